@@ -3,11 +3,23 @@
 #
 
 # %%
+import os
+import numpy as np
 import pandas as pd
-import yfinance as yf
 import plotly.graph_objects as go
-from taipy.gui import Gui, notify
+from taipy.gui import Gui, download, notify
 import taipy.gui.builder as tgb
+from providers import get_prices, get_provider
+from ticker_metadata import market_cap, short_name
+from constituents import company_list, get_constituents
+from warm_up import register_warm_up
+from range_index import build_range_index, query_range
+from indicators import compute_indicators, indicator_config, price_matrix
+from downsampling import max_candles, resample_ohlc
+from figure_cache import cached_figure
+from series_store import get_frame
+from history_table import export_history, get_page, page_size
+from metrics import span, timed
 
 # %% [markdown]
 # [Guidance on using Wikipedia API](https://stackoverflow.com/questions/74836987/how-can-i-extract-all-sections-of-a-wikipedia-page-in-plain-text) <br>
@@ -39,11 +51,8 @@ import taipy.gui.builder as tgb
 #
 
 # %%
-# Get S&P 500 companies with theirs tickers: less stable but faster method
-wiki_url = "https://en.wikipedia.org/wiki/List_of_S&P_500_companies"
-# identify the table in the HTML by its unique id
-sp500 = pd.read_html(wiki_url, attrs={"id": "constituents"})[0]
-sp500.sort_values("Symbol", inplace=True)
+# Companies of the ticker selector, read from the constituents snapshot
+sp500 = get_constituents()
 
 # %%
 ticker = "AAPL"
@@ -53,25 +62,81 @@ interval = "1d"
 
 
 # %%
+history_columns = ["Open", "High", "Low", "Close", "Volume", "MA50", "MA200"]
+# Indicators of indicator_config that can be drawn on the candlestick chart:
+indicator_columns = [
+    "MA50",
+    "MA200",
+    "EMA20",
+    "BB20_upper",
+    "BB20_lower",
+    "VWAP",
+    "RSI14",
+    "ATR14",
+]
+stored_columns = history_columns + [
+    name for name in indicator_columns if name not in history_columns
+]
+
+
+@timed
 def get_stock_data(ticker, start, end, interval):
-    try:
-        stock = yf.Ticker(ticker)
-        stock.info["shortName"]
-    except KeyError:
-        stock = yf.Ticker(ticker.replace(".", "-"))
-    stock_history = stock.history(
-        start=start, end=end, interval=interval, actions=False
-    )
-    stock_history["MA50"] = (
-        stock_history["Close"].rolling(window=50, min_periods=0).mean()
-    )
-    stock_history["MA200"] = (
-        stock_history["Close"].rolling(window=200, min_periods=0).mean()
+    def load():
+        # Coarser bars are aggregated from the daily bars, the indicators are then taken over the
+        # aggregated bars (MA50 is 50 weeks on 1wk) rather than aggregated themselves:
+        stock_history = get_prices(ticker, start, end, interval)
+        if len(stock_history) == 0:
+            # Not stored, update_chart tells that no data was found:
+            return stock_history
+        indicators, _ = compute_indicators(
+            price_matrix({ticker: stock_history}), indicator_config
+        )
+        # A new frame so the slice read from the store is never modified:
+        return pd.concat(
+            [stock_history, indicators.xs(ticker, axis=1, level=1)], axis=1
+        )
+
+    # Sessions looking at the same ticker and dates share one copy of the history:
+    stored = get_frame(ticker, interval, start, end, stored_columns, load)
+    stock_history = stored[history_columns]
+    # The range min/max index is built once per fetched series for the y-axis autoscale:
+    return (
+        stock_history,
+        short_name(ticker),
+        market_cap(ticker, get_provider()["market_cap"]),
+        build_range_index(stock_history),
+        stored[indicator_columns],
     )
-    return stock_history, stock.info["shortName"], stock.info["marketCap"]
 
 
-stock_data = get_stock_data(ticker, start, end, interval)
+# Placeholder until the background warm-up has fetched the default ticker:
+empty_history = pd.DataFrame(
+    columns=history_columns,
+    index=pd.DatetimeIndex([], name="Date"),
+    dtype=float,
+)
+stock_data = (
+    empty_history,
+    "",
+    0,
+    build_range_index(empty_history),
+    empty_history.reindex(columns=indicator_columns),
+)
+
+# %%
+overlay_list = [
+    ("MA50", "MA 50"),
+    ("MA200", "MA 200"),
+    ("EMA20", "EMA 20"),
+    ("BB20", "Bollinger Bands 20"),
+    ("VWAP", "VWAP"),
+    ("RSI14", "RSI 14"),
+    ("ATR14", "ATR 14"),
+]
+overlays = ["MA50", "MA200"]
+# Drawn in a panel of their own below the volume, their scale is not the price's:
+panel_overlays = ["RSI14", "ATR14"]
+overlay_colors = {"MA50": "yellow", "MA200": "#AB63FA"}
 
 
 # %%
@@ -86,13 +151,57 @@ def format_number(num):
     )
 
 
+def format_numbers(values):
+    # Vectorized format_number() for whole columns, e.g. the volume labels of every bar:
+    values = np.asarray(values, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Round to 3 significant digits like "{:.3g}":
+        digits = np.floor(np.log10(np.abs(values)))
+        scale = 10.0 ** np.where(np.isfinite(digits), digits - 2, 0)
+        values = np.round(values / scale) * scale
+        magnitude = np.floor(np.log10(np.abs(values)) / 3)
+    magnitude = np.clip(np.nan_to_num(magnitude), 0, 4).astype(int)
+    return (
+        pd.Series(values / 1000.0**magnitude)
+        .round(2)
+        .astype(str)
+        .str.replace(r"\.0$", "", regex=True)
+        + np.array(["", "K", "M", "B", "T"])[magnitude]
+    )
+
+
+def format_prices(prices):
+    # Vectorized f"{price:,.2f}" using pandas string operations instead of one f-string per row:
+    return (
+        prices.round(2)
+        .astype(str)
+        .str.replace(r"\.(\d)$", r".\g<1>0", regex=True)
+        .str.replace(r"\B(?=(\d{3})+\.)", ",", regex=True)
+    )
+
+
 # %%
+def autoscale_ranges(range_index, x0, x1):
+    y_range = query_range(range_index, x0, x1)
+    if y_range is None:
+        return {}
+    price_min, price_max, volume_min, volume_max = y_range
+    return {
+        "yaxis.range": [price_min * (1 - 0.05), price_max * (1 + 0.05)],
+        "yaxis2.range": [volume_min, volume_max],
+    }
+
+
 def autoscale_yaxis(stock_data):
     last_date = stock_data[0].index[-1]
     one_month, six_months, one_year = [
         last_date - pd.DateOffset(months=i) for i in [1, 6, 12]
     ]
-    ytd = stock_data[0].loc[stock_data[0].index.year == last_date.year].index.min()
+    ytd = stock_data[0].index[
+        stock_data[0].index.searchsorted(
+            pd.Timestamp(year=last_date.year, month=1, day=1)
+        )
+    ]
     xranges = {
         "1 month": [one_month, last_date],
         "6 months": [six_months, last_date],
@@ -109,24 +218,7 @@ def autoscale_yaxis(stock_data):
                 "args": [
                     {
                         "xaxis.range": xrange,
-                        "yaxis.range": [
-                            stock_data[0]
-                            .drop(columns="Volume")
-                            .loc[xrange[0] : xrange[1]]
-                            .min()
-                            .min()
-                            * (1 - 0.05),
-                            stock_data[0]
-                            .drop(columns="Volume")
-                            .loc[xrange[0] : xrange[1]]
-                            .max()
-                            .max()
-                            * (1 + 0.05),
-                        ],
-                        "yaxis2.range": [
-                            stock_data[0].loc[xrange[0] : xrange[1], "Volume"].min(),
-                            stock_data[0].loc[xrange[0] : xrange[1], "Volume"].max(),
-                        ],
+                        **autoscale_ranges(stock_data[3], xrange[0], xrange[1]),
                     }
                 ],
             }
@@ -135,32 +227,46 @@ def autoscale_yaxis(stock_data):
 
 
 # %%
-def create_candlestick_chart(ticker, stock_data):
-    hover_ohlc = [
-        f" {date.strftime("%d/%m/%Y")} <br> Open: <b>${open:,.2f}</b> <br> High: <b>${high:,.2f}</b> <br> Low: <b>${low:,.2f}</b> <br>{'▲' if close > open else '▼'}  Close: <b>${close:,.2f}</b> "
-        for date, open, high, low, close in zip(
-            stock_data[0].index,
-            stock_data[0]["Open"],
-            stock_data[0]["High"],
-            stock_data[0]["Low"],
-            stock_data[0]["Close"],
-        )
-    ]
+@cached_figure
+def create_candlestick_chart(ticker, stock_data, overlays, x0=None, x1=None):
+    # Only the visible range is sent, re-aggregated to as many candles as the chart width can show:
+    history = resample_ohlc(stock_data[0].loc[x0:x1], max_candles)
+    # The selected indicators are re-aggregated into the same buckets, all in one pass:
+    columns = [name for name in stock_data[4].columns if name.split("_")[0] in overlays]
+    lines = resample_ohlc(stock_data[4].loc[x0:x1, columns], max_candles)
+    panels = [name for name in panel_overlays if name in overlays]
+    dates = pd.Series(history.index.strftime("%d/%m/%Y"), index=history.index)
+    directions = np.where(history["Close"] > history["Open"], "▲", "▼")
+    hover_ohlc = (
+        " "
+        + dates
+        + " <br> Open: <b>$"
+        + format_prices(history["Open"])
+        + "</b> <br> High: <b>$"
+        + format_prices(history["High"])
+        + "</b> <br> Low: <b>$"
+        + format_prices(history["Low"])
+        + "</b> <br>"
+        + directions
+        + "  Close: <b>$"
+        + format_prices(history["Close"])
+        + "</b> "
+    )
     fig = go.Figure().set_subplots(
-        2,
+        2 + len(panels),
         1,
         shared_xaxes=True,
-        subplot_titles=("Price", "Volume"),
-        vertical_spacing=0.1,
-        row_heights=[0.7, 0.3],
+        subplot_titles=("Price", "Volume", *panels),
+        vertical_spacing=0.1 if len(panels) == 0 else 0.06,
+        row_heights=[0.7, 0.3] + [0.25] * len(panels),
     )
     fig.add_trace(
         go.Candlestick(
-            x=stock_data[0].index,
-            open=stock_data[0]["Open"],
-            high=stock_data[0]["High"],
-            low=stock_data[0]["Low"],
-            close=stock_data[0]["Close"],
+            x=history.index,
+            open=history["Open"],
+            high=history["High"],
+            low=history["Low"],
+            close=history["Close"],
             name="OHLC",
             increasing_line_color="#00CC96",  # 13e548 or 00d600
             decreasing_line_color="#ff424e",
@@ -171,45 +277,44 @@ def create_candlestick_chart(ticker, stock_data):
         row=1,
         col=1,
     )
-    fig.add_trace(
-        go.Scatter(
-            x=stock_data[0].index,
-            y=stock_data[0]["MA50"],
-            name="MA50",
-            marker_color="yellow",
-            hovertemplate="%{x|%d/%m/%Y}: <b>%{y:$,.2f}</b>",
-        ),
-        row=1,
-        col=1,
-    )
-    fig.add_trace(
-        go.Scatter(
-            x=stock_data[0].index,
-            y=stock_data[0]["MA200"],
-            name="MA200",
-            marker_color="#AB63FA",
-            hovertemplate="%{x|%d/%m/%Y}: <b>%{y:$,.2f}</b>",
-        ),
-        row=1,
-        col=1,
-    )
+    for name in columns:
+        overlay = name.split("_")[0]
+        fig.add_trace(
+            go.Scatter(
+                x=lines.index,
+                y=lines[name],
+                name=name,
+                marker_color=overlay_colors.get(name),
+                line={"dash": "dot", "width": 1} if overlay == "BB20" else None,
+                hovertemplate=(
+                    "%{x|%d/%m/%Y}: <b>%{y:.1f}</b>"
+                    if overlay == "RSI14"
+                    else "%{x|%d/%m/%Y}: <b>%{y:$,.2f}</b>"
+                ),
+            ),
+            row=3 + panels.index(overlay) if overlay in panels else 1,
+            col=1,
+        )
     fig.add_trace(
         go.Bar(
-            x=stock_data[0].index,
-            y=stock_data[0]["Volume"],
+            x=history.index,
+            y=history["Volume"],
             name="Volume",
             showlegend=False,
-            hovertemplate=[
-                f"%{{x|%d/%m/%Y}}: <b>{format_number(y)}</b>"
-                for y in stock_data[0]["Volume"]
-            ],  # {{}} escapes from misinterpreting as variable placeholders by Plotly
+            # One template for every bar, the formatted volumes are passed as customdata:
+            customdata=format_numbers(history["Volume"]),
+            hovertemplate="%{x|%d/%m/%Y}: <b>%{customdata}</b>",
         ),
         row=2,
         col=1,
     )
     fig.update_layout(
         title=f"{ticker}: {stock_data[1]}'s OHLC Price over the Period",
-        xaxis={"rangeslider_visible": False},
+        xaxis={
+            "rangeslider_visible": False,
+            # A figure rebuilt by autoscale_on_zoom stays on the zoomed dates:
+            "range": None if x0 is None and x1 is None else [x0, x1],
+        },
         yaxis={"title": "<b>US$</b>", "fixedrange": False},
         hoverlabel={"namelength": 0},
         margin={"b": 30, "t": 80},
@@ -227,24 +332,91 @@ def create_candlestick_chart(ticker, stock_data):
             }
         ],
     )
+    if x0 is not None or x1 is not None:
+        # The y-axes of a zoomed range are part of the cached figure, which is never changed after:
+        fig.plotly_relayout(autoscale_ranges(stock_data[3], x0, x1))
     return fig
 
 
-# LATER: Need to make y_axis synchronyous autoscale when x_axis is zoomed
+# %%
+# Range shown by the chart, None for the whole history:
+start_range = None
+end_range = None
+
+
+@timed
+def autoscale_on_zoom(state, id, payload):
+    if payload.get("xaxis.autorange"):
+        x0, x1 = None, None
+    elif "xaxis.range" in payload:  # preset buttons
+        x0, x1 = payload["xaxis.range"]
+    elif "xaxis.range[0]" in payload:
+        x0, x1 = payload["xaxis.range[0]"], payload["xaxis.range[1]"]
+    else:
+        return
+    # Rebuild the candles for the new range so that detail comes back when zooming in:
+    figure = create_candlestick_chart(
+        state.ticker, state.stock_data, state.overlays, x0, x1
+    )
+    # Assigning the state serializes the figure and sends it to the browser:
+    with span("state_update"):
+        state.start_range = x0
+        state.end_range = x1
+        state.figure = figure
+
+
+def update_overlays(state):
+    figure = create_candlestick_chart(
+        state.ticker,
+        state.stock_data,
+        state.overlays,
+        state.start_range,
+        state.end_range,
+    )
+    with span("state_update"):
+        state.figure = figure
+
 
 # %%
-figure = create_candlestick_chart(ticker, stock_data)
+figure = go.Figure()
+
+
+def warm_up():
+    global stock_data, figure, history_page, history_rows
+    stock_data = get_stock_data(ticker, start, end, interval)
+    figure = create_candlestick_chart(ticker, stock_data, overlays)
+    history_page, history_rows, _ = get_page(stock_data[0], 0, None, None)
+
+
+def update_session(state):
+    # Only replace the placeholder, a session may already have fetched another ticker:
+    if len(state.stock_data[0]) == 0 and state.ticker == ticker:
+        state.stock_data = stock_data
+        # Built for the default indicators, a session may already have picked others:
+        state.figure = create_candlestick_chart(ticker, stock_data, state.overlays)
+        state.history_page = history_page
+        state.history_rows = history_rows
+
+
+register_warm_up(warm_up, update_session)
 
 
 # %%
+@timed
 def update_chart(state):
     notify(state, "info", "Fetching data")
-    if len(state.stock_data[0]) != 0:
-        state.stock_data = get_stock_data(
-            state.ticker, state.start, state.end, state.interval
-        )
-        state.figure = create_candlestick_chart(state.ticker, state.stock_data)
-        state.refresh("figure")
+    stock_data = get_stock_data(state.ticker, state.start, state.end, state.interval)
+    if len(stock_data[0]) != 0:
+        figure = create_candlestick_chart(state.ticker, stock_data, state.overlays)
+        # Assigning the state serializes the data and the figure and sends them to the browser:
+        with span("state_update"):
+            state.start_range = None
+            state.end_range = None
+            state.stock_data = stock_data
+            state.figure = figure
+            state.refresh("figure")
+            state.table_page = 0
+            update_table(state)
         notify(state, "success", "Historical data has been updated")
     # Notify no data found:
     else:
@@ -256,7 +428,72 @@ def update_chart(state):
 
 
 # %%
-company_list = list(zip(sp500["Symbol"], sp500["Symbol"] + ": " + sp500["Security"]))
+# Historical Data table: one page of rows is sent, sorted and filtered on the server
+table_page = 0
+table_sort = "Date"
+table_descending = False
+table_start = None
+table_end = None
+table_sort_list = ["Date"] + history_columns
+history_page, history_rows, _ = get_page(empty_history, 0, None, None)
+export_path = None
+
+
+@timed
+def update_table(state):
+    history_page, history_rows, table_page = get_page(
+        state.stock_data[0],
+        state.table_page,
+        state.table_start,
+        state.table_end,
+        state.table_sort,
+        state.table_descending,
+    )
+    with span("state_update"):
+        state.history_page = history_page
+        state.history_rows = history_rows
+        state.table_page = table_page
+
+
+def filter_table(state):
+    # A new filter or sort order starts from the first page
+    state.table_page = 0
+    update_table(state)
+
+
+def previous_page(state):
+    state.table_page -= 1
+    update_table(state)
+
+
+def next_page(state):
+    state.table_page += 1
+    update_table(state)
+
+
+def export_table(state, id):
+    # The button id is the file format, "csv" or "parquet"
+    remove_export(state)
+    state.export_path = export_history(
+        state.stock_data[0],
+        state.table_start,
+        state.table_end,
+        state.table_sort,
+        state.table_descending,
+        id,
+    )
+    download(
+        state, state.export_path, f"{state.ticker}_{state.interval}.{id}", remove_export
+    )
+
+
+def remove_export(state, id=None, payload=None):
+    if state.export_path is not None and os.path.exists(state.export_path):
+        os.remove(state.export_path)
+    state.export_path = None
+
+
+# %%
 interval_list = [  # 1 minute is available but date range would be limited to 8 days
     ("1d", "1 day"),
     ("5d", "5 days"),
@@ -354,11 +591,50 @@ with tgb.Page() as stock_page:
                     class_name="h5 pb-half",
                 )
         tgb.html("br")
-        tgb.chart(figure="{figure}")
+        tgb.selector(
+            value="{overlays}",
+            label="Indicators",
+            dropdown=True,
+            multiple=True,
+            lov="{overlay_list}",
+            value_by_id=True,
+            on_change=update_overlays,
+        )
+        tgb.chart(figure="{figure}", on_range_change=autoscale_on_zoom)
         tgb.html("br")
         with tgb.expandable(title="Historical Data", expanded=False):
+            with tgb.layout(columns="1 1 1 1 1", gap="30px", class_name="pb-half"):
+                with tgb.part():
+                    tgb.text("From:", class_name="text-weight700")
+                    tgb.date("{table_start}", format="dd/MM/y", on_change=filter_table)
+                with tgb.part():
+                    tgb.text("To:", class_name="text-weight700")
+                    tgb.date("{table_end}", format="dd/MM/y", on_change=filter_table)
+                with tgb.part():
+                    tgb.text("Sort by:", class_name="text-weight700")
+                    tgb.selector(
+                        value="{table_sort}",
+                        lov="{table_sort_list}",
+                        dropdown=True,
+                        on_change=filter_table,
+                    )
+                    tgb.toggle(
+                        value="{table_descending}",
+                        label="Descending",
+                        on_change=filter_table,
+                    )
+                with tgb.part():
+                    tgb.button("Previous", on_action=previous_page)
+                    tgb.button("Next", on_action=next_page)
+                    tgb.text(
+                        lambda table_page, history_rows: f"Page {table_page + 1} of {max(1, -(-history_rows // page_size))}, {history_rows:,} rows"
+                    )
+                with tgb.part():
+                    tgb.button("Export CSV", id="csv", on_action=export_table)
+                    tgb.button("Export Parquet", id="parquet", on_action=export_table)
+            # Sorting, filtering and paging are done above on the whole history, the table shows a page:
             tgb.table(
-                "{stock_data[0].reset_index()}",
+                "{history_page}",
                 columns={
                     "Date": {"format": "dd/MM/y"},
                     "Open": {},
@@ -368,7 +644,7 @@ with tgb.Page() as stock_page:
                     "Volume": {"format": "%,"},
                 },
                 number_format="$%.2f",
-                filter=True,
+                show_all=True,
             )
 
 # %% [markdown]
@@ -1,18 +1,24 @@
 # %%
+import os
 import pandas as pd
-import yfinance as yf
 import plotly.graph_objects as go
-from concurrent.futures import ThreadPoolExecutor
-from taipy.gui import Gui, notify, invoke_long_callback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from taipy.gui import Gui, navigate, notify, invoke_long_callback
 import taipy.gui.builder as tgb
-from collections import defaultdict
+from providers import get_prices, is_available, resample_bars, source_interval
+from constituents import company_list, get_constituents, security_index
+from warm_up import register_warm_up
+from indicators import compute_indicators
+from downsampling import lttb_frame, minmax_positions
+from figure_cache import cached_figure, cached_parts, data_version
+from series_store import get_frame, price_block
+from live_feed import live_data, live_interval, register_live_update, subscribe
+from race_export import get_animation
+from metrics import span, timed
 
 # %%
-# Get S&P 500 companies with theirs tickers: less stable but faster method
-wiki_url = "https://en.wikipedia.org/wiki/List_of_S&P_500_companies"
-# identify the table in the HTML by its unique id
-sp500 = pd.read_html(wiki_url, attrs={"id": "constituents"})[0]
-sp500.sort_values("Symbol", inplace=True)
+# Get S&P 500 companies with theirs tickers from the local snapshot shared by all pages
+sp500 = get_constituents()
 
 # %%
 ticker_list = [
@@ -35,57 +41,76 @@ interval = "1d"
 #
 
 # %%
-stocks_data_cache = defaultdict(pd.DataFrame)
+# Maximum number of tickers downloaded at the same time:
+max_workers = int(os.environ.get("SP500_MAX_WORKERS", 16))
 
 
+@timed
 def get_stocks_data(tickers_to_fetch, start, end, interval):
-    global stocks_data_cache
-    ticker_modified_list = []
-    for ticker in tickers_to_fetch:
-        try:
-            yf.Ticker(ticker).info["shortName"]
-            ticker_modified_list.append(ticker)
-        except KeyError:
-            ticker_modified = ticker.replace(".", "-")
-            ticker_modified_list.append(ticker_modified)
+    # Coarser intervals are aggregated below from the daily closes, shared with the 1d selection:
+    fetch_interval = source_interval(interval)
 
     def get_stock_data(ticker):
-        stock_history = yf.download(
-            tickers=ticker, start=start, end=end, interval=interval, threads=False
+        # Sessions share one read-only copy of every close series:
+        stock_history = get_frame(
+            ticker,
+            fetch_interval,
+            start,
+            end,
+            ["Close"],
+            lambda: get_prices(ticker, start, end, fetch_interval),
         )
         stock_history = stock_history["Close"]
         return stock_history
 
-    with ThreadPoolExecutor() as executor:
-        fetched_data = pd.DataFrame()
-        for ticker in ticker_modified_list:
-            future = executor.submit(get_stock_data, ticker)
-            fetched_data[ticker] = future.result()
-    fetched_data.columns = tickers_to_fetch
-    # Store fetched_data to stocks_data_cache:
-    for ticker in tickers_to_fetch:
-        stocks_data_cache[
-            (ticker, pd.to_datetime(start).date(), pd.to_datetime(end).date(), interval)
-        ] = fetched_data[[ticker]]
-    return fetched_data
-
+    # Submit every ticker at once and collect them as they complete:
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(get_stock_data, ticker): ticker
+            for ticker in tickers_to_fetch
+        }
+        fetched_data = {
+            futures[future]: future.result() for future in as_completed(futures)
+        }
+    # Build the result frame in one pass and keep the order of the selection:
+    stocks_data = price_block(
+        {ticker: fetched_data[ticker] for ticker in tickers_to_fetch}
+    )
+    if fetch_interval != interval:
+        # One resampling of all the selected tickers:
+        stocks_data = resample_bars(pd.concat({"Close": stocks_data}, axis=1), interval)
+        stocks_data = stocks_data["Close"]
+    return stocks_data
 
-# %% [markdown]
-# ```python
-# # 1. Reindex to include new dates
-#             all_dates = cache[ticker].index.union(fetched_data[ticker].index)
-#             cache[ticker] = cache[ticker].reindex(all_dates)
-#             # 2. Combine with fetched data, prioritizing existing values
-#             cache[ticker] = cache[ticker].combine_first(fetched_data[ticker])
-# ```
-#
 
 # %%
-stocks_data = get_stocks_data(ticker_list, start, end, interval)
+# Placeholder until the background warm-up has fetched the default tickers:
+stocks_data = pd.DataFrame()
+
+
+def warm_up():
+    global stocks_data
+    stocks_data = get_stocks_data(ticker_list, start, end, interval)
+
+
+def update_session(state):
+    # Only replace the placeholder, a session may already have changed its selection:
+    if (
+        len(state.stocks_data.columns) == 0
+        and list(state.ticker_list) == ticker_list
+        and not state.live
+    ):
+        state.stocks_data = stocks_data
+
+
+register_warm_up(warm_up, update_session)
 
 
 # %%
+@timed
 def get_stocks_data_status(state, status, result):
+    if state.live:
+        return  # fetched before the live mode was turned on
     if status:
         additional_ticker = list(
             set(state.ticker_list).difference(set(state.stocks_data.columns))
@@ -94,9 +119,11 @@ def get_stocks_data_status(state, status, result):
             state.stocks_data = result
             notify(state, "success", "Historical data has been updated")
         else:
-            state.stocks_data[additional_ticker] = result
+            state.stocks_data = pd.concat([state.stocks_data, result], axis=1)
             notify(state, "success", f"{additional_ticker[0]} has been added")
-        state.refresh("stocks_data")
+        # Refreshing re-evaluates the figure expressions and sends them to the browser:
+        with span("state_update"):
+            state.refresh("stocks_data")
         # state.refresh("create_cards")
         # state.refresh("create_line_chart")
     else:
@@ -104,7 +131,47 @@ def get_stocks_data_status(state, status, result):
 
 
 # %%
+# Live mode: the last intraday bars of the selected tickers, pushed by the live feed
+live = False
+# Indicators updated by the live feed along with the bars, None outside of the live mode:
+live_indicators = None
+
+
+def show_live(state):
+    subscribe(state.ticker_list)
+    stocks_data, indicators = live_data(state.ticker_list)
+    with span("state_update"):
+        state.stocks_data = stocks_data
+        state.live_indicators = indicators
+
+
+def update_live_session(state):
+    # Throttled push from the live feed, sessions not in the live mode keep their data
+    if state.live:
+        show_live(state)
+
+
+register_live_update(update_live_session)
+
+
+def toggle_live(state):
+    # Intraday and daily prices are not mixed: the selection is loaded again in the other mode
+    state.stocks_data = pd.DataFrame()
+    state.live_indicators = None
+    state.start_range = None
+    state.end_range = None
+    update_charts(state)
+
+
+# %%
+@timed
 def update_charts(state):
+    if state.live:
+        # The live feed fetches the new tickers and pushes their bars to the session:
+        show_live(state)
+        if len(state.stocks_data.columns) < len(state.ticker_list):
+            notify(state, "info", "Waiting for the live bars")
+        return
     notify(state, "info", "Fetching data")
     # Handle when selecting a new ticker from the dropdown selector or change date/interval:
     if len(state.ticker_list) >= len(state.stocks_data.columns):
@@ -116,34 +183,38 @@ def update_charts(state):
         tickers_to_update = (
             ticker_difference if len(ticker_difference) > 0 else state.ticker_list
         )
-        cache_keys = set(
-            (ticker, start, end, state.interval) for ticker in tickers_to_update
-        )
-        keys_to_fetch = cache_keys.difference(stocks_data_cache.keys())
-        keys_in_cache = cache_keys.intersection(stocks_data_cache.keys())
-        if len(keys_to_fetch) > 0:
+        tickers_to_fetch = [
+            ticker
+            for ticker in tickers_to_update
+            if not is_available(ticker, state.interval, start, end)
+        ]
+        tickers_in_cache = [
+            ticker for ticker in tickers_to_update if ticker not in tickers_to_fetch
+        ]
+        if len(tickers_to_fetch) > 0:
             invoke_long_callback(
                 state,
                 get_stocks_data,
-                [[key[0] for key in keys_to_fetch], start, end, state.interval],
+                [tickers_to_fetch, start, end, state.interval],
                 get_stocks_data_status,
             )
-        if len(keys_in_cache) > 0:
-            state.stocks_data = pd.concat(
-                [
-                    stocks_data_cache[(key[0], start, end, state.interval)]
-                    for key in keys_in_cache
-                ],
-                axis=1,
-            )
-            state.refresh("stocks_data")
+        if len(tickers_in_cache) > 0:
+            stocks_data = get_stocks_data(tickers_in_cache, start, end, state.interval)
+            if len(ticker_difference) > 0:
+                # Added tickers join the ones already shown, like get_stocks_data_status does:
+                stocks_data = pd.concat([state.stocks_data, stocks_data], axis=1)
+            # Assigning the state re-evaluates the figure expressions and sends them to the browser:
+            with span("state_update"):
+                state.stocks_data = stocks_data
+                state.refresh("stocks_data")
             notify(state, "success", "Historical data has been updated")
     # Handle when removing a ticker from the dropdown selector by dropping that ticker's column
     elif len(state.ticker_list) < len(state.stocks_data.columns):
         ticker_to_remove = list(
             set(state.stocks_data.columns).difference(set(state.ticker_list))
         )
-        state.stocks_data.drop(ticker_to_remove, axis=1, inplace=True)
+        # A new frame: the previous one may be the warm-up frame shared by other sessions:
+        state.stocks_data = state.stocks_data.drop(columns=ticker_to_remove)
         notify(state, "success", f"{ticker_to_remove[0]} has been removed")
 
 
@@ -152,6 +223,7 @@ start_range = None
 end_range = None
 
 
+@timed
 def update_date_range(state, id, payload):
     state.start_range = payload.get("xaxis.range[0]")
     state.end_range = payload.get("xaxis.range[1]")
@@ -160,7 +232,12 @@ def update_date_range(state, id, payload):
 
 
 # %%
+@cached_figure
 def create_cards(ticker_list, stocks_data, start_range, end_range):
+    # Skip tickers whose data is still being fetched:
+    ticker_list = [ticker for ticker in ticker_list if ticker in stocks_data.columns]
+    if len(ticker_list) == 0:
+        return go.Figure()
     # Dynamically calculate plotly subplot grid layout
     n_plots = len(ticker_list)
     # Square root aims to create a balanced grid with roughly equal numbers of rows and columns:
@@ -182,106 +259,240 @@ def create_cards(ticker_list, stocks_data, start_range, end_range):
         + margin_bottom
     )
     vertical_spacing = row_spacing / total_height
-    fig_sparkline = go.Figure().set_subplots(
-        rows, cols, horizontal_spacing=0.1, vertical_spacing=vertical_spacing
+    # Keep the spacing of the 4-column grid (0.1 for 0.175 wide cards) in proportion to the card
+    # width so that wide grids still fit:
+    width = 1 / (cols + 4 / 7 * (cols - 1))
+    horizontal_spacing = 4 / 7 * width
+    # Subplot domains computed the same way as make_subplots, so the layout is built in one go
+    # instead of validating the whole figure on every add_trace/add_annotation/add_shape:
+    height = (1 - vertical_spacing * (rows - 1)) / rows
+    # Insert rounded-corner borders using SVG `path` syntax, the same path for every card:
+    x0, y0 = -0.4, -0.08
+    x1, y1 = 1.02, annotation_y
+    radius = 0.07
+    rounded_bottom_left = f" M {x0+radius}, {y0} Q {x0}, {y0} {x0}, {y0+radius}"
+    rounded_top_left = f" L {x0}, {y1-radius} Q {x0}, {y1} {x0+radius}, {y1}"
+    rounded_top_right = f" L {x1-radius}, {y1} Q {x1}, {y1} {x1}, {y1-radius}"
+    rounded_bottom_right = f" L {x1}, {y0+radius} Q {x1}, {y0} {x1-radius}, {y0}Z"
+    path = (
+        rounded_bottom_left
+        + rounded_top_left
+        + rounded_top_right
+        + rounded_bottom_right
     )
-    fig_sparkline.update_layout(
-        margin={"l": 100, "r": 30, "t": margin_top, "b": margin_bottom},
-        height=total_height,
-        hoverlabel_align="right",
+    layout = {
+        "margin": {"l": 100, "r": 30, "t": margin_top, "b": margin_bottom},
+        "height": total_height,
+        "hoverlabel": {"align": "right"},
+        "annotations": [],
+        "shapes": [],
+    }
+    visible_data = stocks_data.loc[start_range:end_range, ticker_list]
+
+    def build_cards(tickers):
+        # Calculate deltas and last prices of every ticker in one pass:
+        last_prices = stocks_data[tickers].iloc[-1]
+        delta_percents = last_prices / stocks_data[tickers].iloc[-2] - 1
+        # Sparklines are only a couple hundred pixels wide, downsample every ticker at once:
+        visible_values = visible_data[tickers].to_numpy()
+        positions = minmax_positions(visible_values, 200)
+        cards = {}
+        for i, ticker in enumerate(tickers):
+            delta_percent = delta_percents[ticker]
+            delta_symbol = "▲" if delta_percent >= 0 else "▼"
+            delta_color = "green" if delta_percent >= 0 else "red"
+            cards[ticker] = {
+                "x": visible_data.index[positions[:, i]],
+                "y": visible_values[positions[:, i], i],
+                "delta": f"{ticker}<br><span style='color:{delta_color}'>{delta_symbol} {abs(delta_percent):.2%}</span>",
+                # Company name from the prebuilt symbol -> Security index instead of a table scan:
+                "name": f"<b>{security_index.get(ticker, ticker)}</b><br><br><span style='color:grey'>Last Price</span><br><b>${last_prices[ticker]:,.2f}</b>",
+            }
+        return cards
+
+    # The content of a card does not depend on its place in the grid, so adding or removing a
+    # ticker only builds the card of that ticker and lays the others out again:
+    cards = cached_parts(
+        {
+            ticker: (
+                "card",
+                ticker,
+                data_version(visible_data[ticker]),
+                stocks_data[ticker].iloc[-2:].to_numpy().tobytes(),
+            )
+            for ticker in ticker_list
+        },
+        build_cards,
     )
-    fig_sparkline.update_xaxes(showgrid=False, visible=False)
-    fig_sparkline.update_yaxes(showgrid=False, visible=False)
+    traces = []
     for i, ticker in enumerate(ticker_list):
-        # stocks_data[ticker] = stocks_data[ticker][date_range:] only works twice
-        row = (i // cols) + 1  # round down to whole nearest number
-        col = (i % cols) + 1  # division remainder
-        fig_sparkline.add_trace(
-            go.Scatter(
-                x=stocks_data.loc[start_range:end_range, ticker].index,
-                y=stocks_data.loc[start_range:end_range, ticker],
-                fill="tozeroy",
-                line_color="red",
-                fillcolor="pink",
-                showlegend=False,
-                name=ticker,
-                hovertemplate="%{x|%d/%m/%Y}: <b>%{y:$,.2f}</b>",
-            ),
-            row=row,
-            col=col,
-        )
-        # Calculate delta for annotations:
-        delta_percent = (
-            stocks_data[ticker].iloc[-1] / stocks_data[ticker].iloc[-2]
-        ) - 1
-        delta_symbol = "▲" if delta_percent >= 0 else "▼"
-        delta_color = "green" if delta_percent >= 0 else "red"
-        # Insert annotations:
-        fig_sparkline.add_annotation(
-            text=f"{ticker}<br><span style='color:{delta_color}'>{delta_symbol} {abs(delta_percent):.2%}</span>",
-            xref="x domain",  # Refer to the x-axis domain of the subplot
-            yref="y domain",  # Refer to the y-axis domain of the subplot
-            x=1,  # Position 100% from the left (almost right edge)
-            y=annotation_y,  # Position 115% from the bottom (almost top edge)
-            row=row,
-            col=col,
-            showarrow=False,
-            align="right",
-        )
-        fig_sparkline.add_annotation(
-            text=f"<b>{sp500.loc[sp500["Symbol"]==ticker,"Security"].iloc[0]}</b><br><br><span style='color:grey'>Last Price</span><br><b>${stocks_data[ticker].iloc[-1]:,.2f}</b>",
-            xref="x domain",
-            yref="y domain",
-            x=-0.4,
-            y=annotation_y,
-            row=row,
-            col=col,
-            showarrow=False,
-            align="left",
-        )
-        # Insert rounded-corner borders using SVG `path` syntax:
-        x0, y0 = -0.4, -0.08
-        x1, y1 = 1.02, annotation_y
-        radius = 0.07
-        rounded_bottom_left = f" M {x0+radius}, {y0} Q {x0}, {y0} {x0}, {y0+radius}"
-        rounded_top_left = f" L {x0}, {y1-radius} Q {x0}, {y1} {x0+radius}, {y1}"
-        rounded_top_right = f" L {x1-radius}, {y1} Q {x1}, {y1} {x1}, {y1-radius}"
-        rounded_bottom_right = f" L {x1}, {y0+radius} Q {x1}, {y0} {x1-radius}, {y0}Z"
-        path = (
-            rounded_bottom_left
-            + rounded_top_left
-            + rounded_top_right
-            + rounded_bottom_right
+        row = i // cols  # round down to whole nearest number
+        col = i % cols  # division remainder
+        # Axis names of the subplot: x, y for the first one then x2, y2...
+        suffix = "" if i == 0 else str(i + 1)
+        layout[f"xaxis{suffix}"] = {
+            "domain": [
+                col * (width + horizontal_spacing),
+                col * (width + horizontal_spacing) + width,
+            ],
+            "anchor": f"y{suffix}",
+            "showgrid": False,
+            "visible": False,
+        }
+        layout[f"yaxis{suffix}"] = {
+            "domain": [
+                # Rounding can take the bottom row a hair below 0:
+                max(0, 1 - row * (height + vertical_spacing) - height),
+                1 - row * (height + vertical_spacing),
+            ],
+            "anchor": f"x{suffix}",
+            "showgrid": False,
+            "visible": False,
+        }
+        traces.append(
+            {
+                "type": "scatter",
+                "x": cards[ticker]["x"],
+                "y": cards[ticker]["y"],
+                "xaxis": f"x{suffix}",
+                "yaxis": f"y{suffix}",
+                "fill": "tozeroy",
+                "line": {"color": "red"},
+                "fillcolor": "pink",
+                "showlegend": False,
+                "name": ticker,
+                "hovertemplate": "%{x|%d/%m/%Y}: <b>%{y:$,.2f}</b>",
+            }
         )
-        fig_sparkline.add_shape(
-            type="path",
-            path=path,
-            xref="x domain",
-            yref="y domain",
-            row=row,
-            col=col,
-            line={"color": "grey"},
+        layout["annotations"] += [
+            {
+                "text": cards[ticker]["delta"],
+                "xref": f"x{suffix} domain",  # Refer to the x-axis domain of the subplot
+                "yref": f"y{suffix} domain",  # Refer to the y-axis domain of the subplot
+                "x": 1,  # Position 100% from the left (almost right edge)
+                "y": annotation_y,  # Position 115% from the bottom (almost top edge)
+                "showarrow": False,
+                "align": "right",
+            },
+            {
+                "text": cards[ticker]["name"],
+                "xref": f"x{suffix} domain",
+                "yref": f"y{suffix} domain",
+                "x": -0.4,
+                "y": annotation_y,
+                "showarrow": False,
+                "align": "left",
+            },
+        ]
+        layout["shapes"].append(
+            {
+                "type": "path",
+                "path": path,
+                "xref": f"x{suffix} domain",
+                "yref": f"y{suffix} domain",
+                "line": {"color": "grey"},
+            }
         )
+    # The dicts above match what set_subplots/add_trace/add_annotation/add_shape produce, so the
+    # per-property validation that dominated the build time of large grids is skipped:
+    fig_sparkline = go.Figure(data=traces, layout=layout, _validate=False)
     return fig_sparkline
 
 
 # %%
-create_cards(ticker_list, stocks_data, start_range, end_range)
+# Indicators that only need the close prices held in stocks_data:
+overlay_config = {"sma": [50, 200], "ema": [20], "bollinger": [20]}
+overlay_list = [
+    ("MA50", "MA 50"),
+    ("MA200", "MA 200"),
+    ("EMA20", "EMA 20"),
+    ("BB20", "Bollinger Bands 20"),
+]
+overlays = []
 
 
-# %%
-def create_line_chart(ticker_list, stocks_data):
-    fig_line_chart = go.Figure()
-    for ticker in ticker_list:
-        fig_line_chart.add_trace(
-            go.Scatter(
-                x=stocks_data[ticker].index,
-                y=stocks_data[ticker],
-                name=ticker,
-                showlegend=True,
-                hovertemplate="%{x|%d/%m/%Y}: <b>%{y:$,.2f}</b>",
+@cached_figure
+def create_line_chart(
+    ticker_list, stocks_data, overlays, start_range, end_range, indicators=None
+):
+    # Tickers still downloading are drawn once get_stocks_data_status adds their column:
+    ticker_list = [ticker for ticker in ticker_list if ticker in stocks_data.columns]
+    # Only the visible range is sent, downsampled to the chart width. The figure is rebuilt when
+    # zooming changes start_range/end_range so that detail comes back:
+    visible_data = stocks_data.loc[start_range:end_range]
+
+    def build_lines(tickers):
+        lines = {}
+        # Every new ticker is downsampled in one pass over the visible matrix:
+        for ticker, line in lttb_frame(visible_data[tickers]).items():
+            lines[ticker] = {
+                "line": {
+                    "type": "scatter",
+                    "x": line.index,
+                    "y": line.to_numpy(),
+                    "name": ticker,
+                    "legendgroup": ticker,
+                    "showlegend": True,
+                    "hovertemplate": "%{x|%d/%m/%Y}: <b>%{y:$,.2f}</b>",
+                },
+                "overlays": [],
+            }
+        if len(overlays) > 0:
+            # All new tickers are computed in one pass, the loop below only adds the traces. In
+            # the live mode they come updated from the feed:
+            ticker_indicators = indicators
+            if ticker_indicators is None:
+                ticker_indicators, _ = compute_indicators(
+                    pd.concat({"Close": stocks_data[tickers]}, axis=1), overlay_config
+                )
+            names = [
+                name
+                for name in ticker_indicators.columns.unique(0)
+                if name.split("_")[0] in overlays
+            ]
+            overlay_lines = lttb_frame(
+                ticker_indicators.loc[
+                    start_range:end_range,
+                    [(name, ticker) for name in names for ticker in tickers],
+                ]
             )
-        )
+            for (name, ticker), line in overlay_lines.items():
+                lines[ticker]["overlays"].append(
+                    {
+                        "type": "scatter",
+                        "x": line.index,
+                        "y": line.to_numpy(),
+                        "name": f"{ticker} {name}",
+                        "legendgroup": ticker,
+                        "line": {"dash": "dot", "width": 1},
+                        "hovertemplate": "%{x|%d/%m/%Y}: <b>%{y:$,.2f}</b>",
+                    }
+                )
+        return lines
+
+    # Traces of the tickers already drawn are reused, so adding or removing a ticker only builds
+    # the traces of that ticker. Indicators depend on the whole history, not only the visible range:
+    lines = cached_parts(
+        {
+            ticker: (
+                "line",
+                ticker,
+                data_version(stocks_data[ticker]),
+                start_range,
+                end_range,
+                tuple(overlays),
+            )
+            for ticker in ticker_list
+        },
+        build_lines,
+    )
+    # Lines first then the overlays grouped by indicator, as they were added before:
+    traces = [lines[ticker]["line"] for ticker in ticker_list] + [
+        trace
+        for group in zip(*(lines[ticker]["overlays"] for ticker in ticker_list))
+        for trace in group
+    ]
+    fig_line_chart = go.Figure(data=traces, _validate=False)
     fig_line_chart.update_xaxes(
         rangeselector={
             "buttons": [
@@ -320,15 +531,36 @@ def create_line_chart(ticker_list, stocks_data):
         margin={"b": 30, "t": 80},
         hoverlabel_align="right",
     )
+    if start_range is not None or end_range is not None:
+        # The downsampled traces only cover the zoomed range, so the axis must not autorange:
+        fig_line_chart.update_xaxes(range=[start_range, end_range])
     return fig_line_chart
 
 
 # %%
-create_line_chart(ticker_list, stocks_data)
+@timed
+def show_race(state):
+    # Bar chart race of the selection, rendered once then served from the animations directory
+    data = state.stocks_data[
+        [ticker for ticker in state.ticker_list if ticker in state.stocks_data.columns]
+    ]
+    if len(data.columns) < 2:
+        notify(state, "info", "Select at least two tickers for a race")
+        return
+    if not state.live and state.interval in ("1d", "5d", "1wk"):
+        # One period per month keeps multi-year races short enough to watch:
+        data = resample_bars(pd.concat({"Close": data}, axis=1), "1mo")["Close"]
+    name = get_animation(
+        data,
+        "html",
+        n_bars=min(10, len(data.columns)),
+        title="<b>Highest Stock Price</b>",
+    )
+    navigate(state, f"/animations/{name}", tab="_blank")
+
 
 # %%
-company_list = list(zip(sp500["Symbol"], sp500["Symbol"] + ": " + sp500["Security"]))
-interval_list = [  # 1 minute is available but date range would be limited to 8 days
+interval_list = [  # 1 minute is limited to 8 days, it is shown by the live mode instead
     ("1d", "1 day"),
     ("5d", "5 days"),
     ("1wk", "1 week"),
@@ -373,12 +605,27 @@ with tgb.Page() as stocks_page:
                     value_by_id=True,
                     class_name="mb-half",
                 )
+                tgb.toggle(
+                    value="{live}",
+                    label=f"Live {live_interval} bars",
+                    on_change=toggle_live,
+                    class_name="mb-half",
+                )
+                tgb.selector(
+                    value="{overlays}",
+                    label="Indicators",
+                    dropdown=True,
+                    multiple=True,
+                    lov="{overlay_list}",
+                    value_by_id=True,
+                )
+                tgb.button("Bar chart race", on_action=show_race, class_name="mt-half")
         tgb.html("br")
         tgb.chart(
             figure="{create_cards(ticker_list,stocks_data,start_range,end_range)}"
         )
         tgb.html("br")
         tgb.chart(
-            figure="{create_line_chart(ticker_list,stocks_data)}",
+            figure="{create_line_chart(ticker_list,stocks_data,overlays,start_range,end_range,live_indicators)}",
             on_range_change=update_date_range,
         )
@@ -1,25 +1,17 @@
-from taipy.gui import Gui
-import taipy.gui.builder as tgb
-from SP500_stock_dashboard import stock_page
-from SP500_stocks_dashboard import stocks_page
-
-with tgb.Page() as root_page:
-    with tgb.part("container"):
-        with tgb.layout("30rem 1", class_name="card p0 pt-half"):
-            tgb.text("S&P 500 stocks visualization", class_name="text-weight900 pl1")
-            with tgb.part("text-center"):
-                tgb.navbar()
-    tgb.html("br")
-
-pages = {"/": root_page, "stock": stock_page, "stocks": stocks_page}
-
-tp_app = Gui(pages=pages)
+# Entry point, `python app.py` or `gunicorn app:app`. The render processes of race_export are
+# spawned and import this script again as __mp_main__: the dashboard is only built, and the
+# background tasks started, from server.py when the script is run or served.
 if __name__ == "__main__":
+    from server import start_background_tasks, tp_app
+
+    start_background_tasks()
     tp_app.run(watermark="")
-else:
+elif __name__ != "__mp_main__":
+    from server import start_background_tasks, tp_app
+
+    start_background_tasks()
     app = tp_app.run(
         run_server=False,
         watermark="",
         title="S&P 500 stocks visualization",
     )
-    # flask_app = app.get_flask_app()
@@ -0,0 +1,40 @@
+# %%
+import json
+import os
+import threading
+import pyarrow as pa
+import pyarrow.feather as feather
+
+# %% [markdown]
+# Files of the persistent stores (prices, fundamentals): one frame per uncompressed Arrow IPC file
+# (Feather v2) so it can be memory-mapped on read instead of parsed, with a JSON value in the schema
+# metadata such as the date ranges covered or the time of the last fetch.<br>
+# [Feather / Arrow IPC file format](https://arrow.apache.org/docs/python/feather.html)
+#
+
+
+# %%
+def read_metadata(path, key):
+    # Only the schema is read, no column data is touched:
+    with pa.memory_map(path) as source:
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+    return json.loads(metadata[key]) if key in metadata else None
+
+
+def read_frame(path, key):
+    # (frame, JSON value stored under key or None)
+    table = feather.read_table(path, memory_map=True)
+    metadata = table.schema.metadata or {}
+    return table.to_pandas(), (json.loads(metadata[key]) if key in metadata else None)
+
+
+def write_frame(path, frame, key, value):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(frame)
+    table = table.replace_schema_metadata(
+        {**(table.schema.metadata or {}), key: json.dumps(value).encode()}
+    )
+    # Write to a temporary file then rename so that other workers never read a half-written file:
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
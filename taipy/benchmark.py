@@ -0,0 +1,257 @@
+# %%
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+# %% [markdown]
+# Benchmarks of the fetch, transform and figure-building hot paths on synthetic OHLCV data, without
+# network: the pages read a generated dump through the local provider. Ticker counts and history
+# lengths are swept, the wall time (best of `--repeat` runs, caches cleared before each run) and the
+# peak memory (one extra run under tracemalloc) are compared against a saved baseline.<br>
+# Usage, from the taipy directory: `python benchmark.py --save` once to record the baseline, then
+# `python benchmark.py` to compare. The exit code is 1 when a case is slower than the threshold.<br>
+# [tracemalloc](https://docs.python.org/3/library/tracemalloc.html)
+#
+
+# %%
+work_dir = tempfile.mkdtemp(prefix="sp500_benchmark_")
+max_tickers = 500
+tickers = [f"T{i:03d}" for i in range(max_tickers)]
+# Name -> bar timestamps, "max" is as long as the notebooks' stock_price_max.csv dump:
+lengths = {
+    "1y": pd.bdate_range(end="2024-12-31", periods=252),
+    "5y": pd.bdate_range(end="2024-12-31", periods=5 * 252),
+    "max": pd.bdate_range(end="2024-12-31", periods=15861),
+    # 5-minute bars of the last 60 sessions, served as stored by the local provider:
+    "intraday": pd.DatetimeIndex(
+        [
+            day + pd.Timedelta(hours=9, minutes=30) + pd.Timedelta(minutes=5 * i)
+            for day in pd.bdate_range(end="2024-12-31", periods=60)
+            for i in range(78)
+        ]
+    ),
+}
+default_baseline = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "benchmark_baseline.json"
+)
+
+# The pages are configured before they are imported: local provider and a constituents snapshot of
+# the synthetic tickers so that nothing is scraped or downloaded.
+os.environ["SP500_PROVIDER"] = "local"
+os.environ["SP500_STORE_DIR"] = os.path.join(work_dir, "prices")
+os.environ["SP500_CONSTITUENTS_DIR"] = os.path.join(work_dir, "constituents")
+os.environ["SP500_CONSTITUENTS_REFRESH"] = str(10 * 365 * 24 * 60 * 60)
+os.makedirs(os.environ["SP500_CONSTITUENTS_DIR"])
+pd.DataFrame({"Symbol": tickers, "Security": tickers}).to_parquet(
+    os.path.join(os.environ["SP500_CONSTITUENTS_DIR"], "sp500_20000101000000.parquet")
+)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import figure_cache
+import providers
+import series_store
+import SP500_stock_dashboard as stock_dashboard
+import SP500_stocks_dashboard as stocks_dashboard
+from race_frames import race_frames
+
+
+# %%
+def write_dump(length):
+    # Candles of every ticker around a geometric random walk of the closes, same seed for every
+    # run, in the long Date/Ticker layout of the local provider:
+    dates = lengths[length]
+    rng = np.random.default_rng(0)
+    shape = (len(dates), max_tickers)
+    close = 100 * np.exp(rng.normal(0.0003, 0.02, shape).cumsum(axis=0))
+    open_ = close * np.exp(rng.normal(0, 0.01, shape))
+    high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0, 0.01, shape)))
+    low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0, 0.01, shape)))
+    volume = rng.integers(100_000, 10_000_000, shape).astype(float)
+    dump = pd.DataFrame(
+        {
+            "Date": np.repeat(dates.to_numpy(), max_tickers),
+            "Ticker": pd.Categorical(np.tile(tickers, len(dates)), categories=tickers),
+            "Open": open_.ravel(),
+            "High": high.ravel(),
+            "Low": low.ravel(),
+            "Close": close.ravel(),
+            "Volume": volume.ravel(),
+        }
+    )
+    path = os.path.join(work_dir, f"{length}.arrow")
+    dump.to_feather(path)
+    return path
+
+
+def clear_caches():
+    figure_cache.figure_cache.clear()
+    figure_cache.part_cache.clear()
+    series_store.pinned.clear()
+    series_store.pinned_bytes = 0
+    series_store.pinned_counts.clear()
+    series_store.shared_indexes.clear()
+    series_store.shared_values.clear()
+    gc.collect()
+
+
+def measure(func, repeat):
+    # Best wall time of the runs, then one run under tracemalloc (which slows Python code down) for
+    # the peak memory allocated by the call
+    times = []
+    for _ in range(repeat):
+        clear_caches()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+        if times[-1] > 1:
+            break  # slow cases vary little from one run to the next
+    clear_caches()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak / 2**20
+
+
+# %%
+def benchmark_cases(length, n_tickers):
+    dates = lengths[length]
+    start, end = dates[0], dates[-1]
+    selection = tickers[:n_tickers]
+    stocks_data = stocks_dashboard.get_stocks_data(selection, start, end, "1d")
+    cases = {
+        "get_stocks_data": lambda: stocks_dashboard.get_stocks_data(
+            selection, start, end, "1d"
+        ),
+        "create_cards": lambda: stocks_dashboard.create_cards(
+            selection, stocks_data, None, None
+        ),
+        "create_line_chart": lambda: stocks_dashboard.create_line_chart(
+            selection, stocks_data, [], None, None
+        ),
+        "create_line_chart+overlays": lambda: stocks_dashboard.create_line_chart(
+            selection, stocks_data, ["MA50", "MA200", "EMA20", "BB20"], None, None
+        ),
+    }
+    if n_tickers > 1:
+        # Top 10 of every bar, one frame per bar:
+        cases["race_frames"] = lambda: sum(
+            1 for _ in race_frames(stocks_data, n_bars=10, steps_per_period=1)
+        )
+    if n_tickers == 1:
+        # The stock page shows one ticker at a time:
+        ticker = selection[0]
+        stock_data = stock_dashboard.get_stock_data(ticker, start, end, "1d")
+        volumes = stock_data[0]["Volume"].to_numpy()
+        cases.update(
+            {
+                "get_stock_data": lambda: stock_dashboard.get_stock_data(
+                    ticker, start, end, "1d"
+                ),
+                "create_candlestick_chart": lambda: stock_dashboard.create_candlestick_chart(
+                    ticker, stock_data, stock_dashboard.overlays
+                ),
+                "autoscale_yaxis": lambda: stock_dashboard.autoscale_yaxis(stock_data),
+                "format_number": lambda: [
+                    stock_dashboard.format_number(volume) for volume in volumes
+                ],
+                "format_numbers": lambda: stock_dashboard.format_numbers(volumes),
+            }
+        )
+    return cases
+
+
+def run_benchmarks(ticker_counts, length_names, repeat):
+    results = []
+    for length in length_names:
+        providers.local_path = write_dump(length)
+        providers.local_prices = None
+        providers.get_local_prices()  # the dump is read once, not timed
+        for n_tickers in ticker_counts:
+            for name, func in benchmark_cases(length, n_tickers).items():
+                wall_time, peak = measure(func, repeat)
+                results.append(
+                    {
+                        "case": name,
+                        "length": length,
+                        "bars": len(lengths[length]),
+                        "tickers": n_tickers,
+                        "time_s": wall_time,
+                        "peak_mb": peak,
+                    }
+                )
+                print(
+                    f"{name:28} {length:>9} {n_tickers:>4} tickers "
+                    f"{wall_time * 1000:10.1f} ms {peak:9.1f} MB"
+                )
+    return pd.DataFrame(results)
+
+
+# %%
+def compare(results, baseline, threshold):
+    keys = ["case", "length", "tickers"]
+    merged = results.merge(baseline, on=keys, how="left", suffixes=("", "_baseline"))
+    merged["time_ratio"] = merged["time_s"] / merged["time_s_baseline"]
+    merged["peak_ratio"] = merged["peak_mb"] / merged["peak_mb_baseline"]
+    merged["status"] = np.select(
+        [
+            merged["time_s_baseline"].isna(),
+            merged["time_ratio"] > 1 + threshold,
+            merged["time_ratio"] < 1 - threshold,
+        ],
+        ["new", "slower", "faster"],
+        "same",
+    )
+    return merged[keys + ["time_s", "time_ratio", "peak_mb", "peak_ratio", "status"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks of the dashboards hot paths on synthetic data"
+    )
+    parser.add_argument("--tickers", type=int, nargs="+", default=[1, 10, 100, 500])
+    parser.add_argument(
+        "--lengths", nargs="+", choices=list(lengths), default=list(lengths)
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", default=default_baseline)
+    parser.add_argument(
+        "--save", action="store_true", help="save the results as the new baseline"
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="relative change to report"
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.tickers, args.lengths, args.repeat)
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as file:
+            json.dump(results.to_dict("records"), file, indent=1)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save first")
+        return 0
+    with open(args.baseline) as file:
+        baseline = pd.DataFrame(json.load(file))
+    comparison = compare(results, baseline, args.threshold)
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(comparison.to_string(index=False, float_format="{:.3f}".format))
+    return 1 if (comparison["status"] == "slower").any() else 0
+
+
+if __name__ == "__main__":
+    try:
+        exit_code = main()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    sys.exit(exit_code)
@@ -0,0 +1,124 @@
+# %%
+import glob
+import logging
+import os
+import threading
+import time
+import pandas as pd
+from ticker_metadata import load_constituents
+from providers import local_constituents, provider_name
+from metrics import count
+
+# %% [markdown]
+# S&P 500 constituents shared by every page. The Wikipedia table is scraped at most once per refresh
+# interval and saved as a dated Parquet snapshot, so importing the pages only reads a local file.
+#
+
+# %%
+logger = logging.getLogger(__name__)
+wiki_url = "https://en.wikipedia.org/wiki/List_of_S&P_500_companies"
+snapshot_dir = os.environ.get(
+    "SP500_CONSTITUENTS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "constituents"),
+)
+# Seconds between two scrapes of the Wikipedia table:
+refresh_interval = int(os.environ.get("SP500_CONSTITUENTS_REFRESH", 24 * 60 * 60))
+snapshots_to_keep = 7
+
+sp500 = None
+# Prebuilt for the pages and filled in place so every importer sees the refreshed values:
+company_list = []
+security_index = {}
+lock = threading.Lock()
+
+
+# %%
+def scrape_constituents():
+    # identify the table in the HTML by its unique id
+    sp500 = pd.read_html(wiki_url, attrs={"id": "constituents"})[0]
+    sp500.sort_values("Symbol", inplace=True)
+    return sp500.reset_index(drop=True)
+
+
+def initial_constituents():
+    try:
+        return scrape_constituents()
+    except Exception:
+        # Running offline from a local dump, its tickers stand in for the table:
+        if provider_name != "local":
+            raise
+        return local_constituents()
+
+
+def latest_snapshot():
+    # Snapshot names are dated so the last one in alphabetical order is the newest:
+    snapshots = sorted(glob.glob(os.path.join(snapshot_dir, "sp500_*.parquet")))
+    return snapshots[-1] if len(snapshots) > 0 else None
+
+
+def save_snapshot(sp500):
+    os.makedirs(snapshot_dir, exist_ok=True)
+    path = os.path.join(snapshot_dir, f"sp500_{time.strftime('%Y%m%d%H%M%S')}.parquet")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    sp500.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    for old_path in sorted(glob.glob(os.path.join(snapshot_dir, "sp500_*.parquet")))[
+        :-snapshots_to_keep
+    ]:
+        os.remove(old_path)
+    return path
+
+
+def set_constituents(new_sp500):
+    global sp500
+    sp500 = new_sp500
+    company_list[:] = list(
+        zip(sp500["Symbol"], sp500["Symbol"] + ": " + sp500["Security"])
+    )
+    security_index.clear()
+    security_index.update(zip(sp500["Symbol"], sp500["Security"]))
+    load_constituents(sp500)
+
+
+def snapshot_age(path):
+    # Seconds since the snapshot was saved, infinite without one (e.g. the files were deleted, or
+    # removed by another worker since they were listed) so that a new one is scraped
+    if path is None:
+        return float("inf")
+    try:
+        return time.time() - os.path.getmtime(path)
+    except OSError:
+        return float("inf")
+
+
+# %%
+def refresh_constituents():
+    path = latest_snapshot()
+    # Another worker may already have scraped a newer snapshot, in which case it is only read:
+    if path is None or snapshot_age(path) >= refresh_interval:
+        path = save_snapshot(scrape_constituents())
+    set_constituents(pd.read_parquet(path))
+
+
+def refresh_loop():
+    while True:
+        try:
+            time.sleep(max(refresh_interval - snapshot_age(latest_snapshot()), 60))
+            refresh_constituents()
+        except Exception as error:
+            # Keep serving the last snapshot when Wikipedia can't be reached:
+            logger.warning("Failed to refresh S&P 500 constituents: %s", error)
+            count("errors_total", {"task": "constituents"})
+
+
+def get_constituents():
+    # Lazily load the latest snapshot (scraping only when there is none yet) and start the
+    # background refresh the first time the constituents are needed:
+    with lock:
+        if sp500 is None:
+            path = latest_snapshot()
+            if path is None:
+                path = save_snapshot(initial_constituents())
+            set_constituents(pd.read_parquet(path))
+            threading.Thread(target=refresh_loop, daemon=True).start()
+    return sp500
@@ -0,0 +1,113 @@
+# %%
+import os
+import numpy as np
+import pandas as pd
+
+# %% [markdown]
+# Downsampling between the data frames and the figures so the payload sent to the browser is bounded
+# by the chart width in pixels, whatever the length of the history.<br>
+# [Largest-Triangle-Three-Buckets (LTTB), Sveinn Steinarsson 2013](https://skemman.is/bitstream/1946/15343/3/SS_MSthesis.pdf)
+#
+
+# %%
+# Width in pixels that the charts are downsampled for:
+chart_width = int(os.environ.get("SP500_CHART_WIDTH", 1600))
+line_points = 2 * chart_width  # 2 points per pixel keep lines visually identical
+max_candles = chart_width // 4  # a candle needs a few pixels to be readable
+
+
+# %%
+def lttb_positions(x, values, n_out):
+    # Row positions picked for every column of a 2-D array. The buckets are walked once and each
+    # step picks the point of all the columns together; a NaN is only picked from a bucket of NaN
+    n, n_columns = values.shape
+    if n_out >= n or n_out < 3:
+        return np.repeat(np.arange(n)[:, None], n_columns, axis=1)
+    # The first and last points are kept, the others are split into n_out - 2 buckets:
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    # Average point of every bucket, computed in one pass, NaN left out:
+    avg_x = np.add.reduceat(x[: n - 1], edges[:-1]) / np.diff(edges)
+    valid = ~np.isnan(values[: n - 1])
+    sums = np.add.reduceat(np.where(valid, values[: n - 1], 0), edges[:-1], axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_y = sums / np.add.reduceat(valid, edges[:-1], axis=0)
+    avg_x, avg_y = np.append(avg_x[1:], x[-1]), np.vstack([avg_y[1:], values[-1:]])
+    selected = np.empty((n_out, n_columns), dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    columns = np.arange(n_columns)
+    a = np.zeros(n_columns, dtype=int)
+    for k in range(n_out - 2):
+        start, stop = edges[k], edges[k + 1]
+        x_a, y_a = x[a], values[a, columns]
+        # Keep the point making the largest triangle with the previous point and the next average:
+        areas = np.abs(
+            (x_a - avg_x[k]) * (values[start:stop] - y_a)
+            - (x_a - x[start:stop, None]) * (avg_y[k] - y_a)
+        )
+        a = start + np.argmax(np.nan_to_num(areas, nan=-1), axis=0)
+        selected[k + 1] = a
+    return selected
+
+
+def lttb_indices(x, y, n_out):
+    return lttb_positions(x, y[:, None], n_out)[:, 0]
+
+
+def lttb(series, n_out=line_points):
+    series = series.dropna()
+    if len(series) <= n_out:
+        return series
+    x = series.index.to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(float)
+    return series.iloc[lttb_indices(x, series.to_numpy(dtype=float), n_out)]
+
+
+def lttb_frame(frame, n_out=line_points):
+    # {column: downsampled series without NaN} of every column of the frame at once
+    x = frame.index.to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(float)
+    values = frame.to_numpy(dtype=float)
+    positions = lttb_positions(x, values, n_out)
+    lines = {}
+    for i, column in enumerate(frame.columns):
+        rows = positions[:, i][~np.isnan(values[positions[:, i], i])]
+        lines[column] = pd.Series(values[rows, i], index=frame.index[rows])
+    return lines
+
+
+def minmax_positions(values, n_out):
+    # Row positions of the min and max of every bucket, for all columns of a 2-D array in one pass
+    n, n_columns = values.shape
+    if n <= n_out:
+        return np.repeat(np.arange(n)[:, None], n_columns, axis=1)
+    size = -(-n // (n_out // 2))  # rows per bucket, rounded up
+    n_buckets = -(-n // size)
+    # Pad to whole buckets; NaN never wins the min or max, a bucket of NaN only keeps a gap:
+    # float32 prices stay float32:
+    dtype = values.dtype if values.dtype.kind == "f" else float
+    padded = np.full((n_buckets * size, n_columns), np.nan, dtype=dtype)
+    padded[:n] = values
+    buckets = padded.reshape(n_buckets, size, n_columns)
+    starts = (np.arange(n_buckets) * size)[:, None]
+    lows = starts + np.argmin(np.where(np.isnan(buckets), np.inf, buckets), axis=1)
+    highs = starts + np.argmax(np.where(np.isnan(buckets), -np.inf, buckets), axis=1)
+    # Keep the time order of the min and max within each bucket:
+    return np.minimum(np.sort(np.concatenate([lows, highs]), axis=0), n - 1)
+
+
+# %%
+def resample_ohlc(history, n_out=max_candles):
+    # Re-aggregate consecutive bars into n_out OHLC buckets, each labelled by its first date
+    if len(history) <= n_out:
+        return history
+    buckets = np.arange(len(history)) * n_out // len(history)
+    ohlcv = {
+        "Open": "first",
+        "High": "max",
+        "Low": "min",
+        "Close": "last",
+        "Volume": "sum",
+    }
+    # Other columns (moving averages, indicators) keep the last value of the bucket:
+    aggregations = {column: ohlcv.get(column, "last") for column in history.columns}
+    resampled = history.groupby(buckets).agg(aggregations)
+    resampled.index = history.index[np.searchsorted(buckets, resampled.index)]
+    return resampled
@@ -0,0 +1,101 @@
+# %%
+import functools
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from metrics import cache_result, figure_points, observe, points_buckets, span
+
+# %% [markdown]
+# Process-wide LRU cache of Plotly figures shared by every session. Taipy re-evaluates the figure
+# expressions of a page whenever one of their variables changes, so identical views (e.g. the default
+# tickers) are only built once. Data frames are keyed on a cheap version token, not on their content.<br>
+# Figures are also assembled from per-ticker parts (traces, annotations) kept in a second cache, so
+# adding or removing one ticker only builds the parts of that ticker.
+#
+
+# %%
+max_figures = int(os.environ.get("SP500_FIGURE_CACHE_SIZE", 128))
+max_parts = int(os.environ.get("SP500_FIGURE_PART_CACHE_SIZE", 4096))
+figure_cache = OrderedDict()
+part_cache = OrderedDict()
+lock = threading.Lock()
+
+
+def data_version(data):
+    # Shape, labels, date bounds and a checksum of the values, computed at C speed
+    if isinstance(data, pd.DataFrame):
+        labels, values = tuple(data.columns), data.select_dtypes("number")
+    else:
+        labels, values = data.name, data
+    if len(data) == 0:
+        return (labels, data.shape)
+    return (
+        labels,
+        data.shape,
+        data.index[0],
+        data.index[-1],
+        float(np.nansum(values.to_numpy(dtype=float))),
+    )
+
+
+def cache_key(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return data_version(value)
+    if isinstance(value, (list, tuple)):
+        return tuple(cache_key(item) for item in value)
+    if isinstance(value, dict):
+        # Derived structures such as the range index follow the frame they were built from:
+        return tuple(value.keys())
+    return value
+
+
+# %%
+def cached_figure(builder):
+    @functools.wraps(builder)
+    def cached_builder(*args):
+        key = (builder.__module__, builder.__name__, *(cache_key(arg) for arg in args))
+        with lock:
+            if key in figure_cache:
+                figure_cache.move_to_end(key)
+                cache_result("figure", hits=1)
+                return figure_cache[key]
+        cache_result("figure", hits=0, misses=1)
+        with span(builder.__name__):
+            figure = builder(*args)
+        observe(
+            "figure_points",
+            {"figure": builder.__name__},
+            figure_points(figure),
+            points_buckets,
+        )
+        with lock:
+            figure_cache[key] = figure
+            while len(figure_cache) > max_figures:
+                figure_cache.popitem(last=False)
+        return figure
+
+    return cached_builder
+
+
+def cached_parts(keys, build):
+    # keys maps every item (ticker) to its cache key, build(items) returns {item: part} for the
+    # items missing from the cache so that they are still built together in one pass
+    parts = {}
+    with lock:
+        for item, key in keys.items():
+            if key in part_cache:
+                part_cache.move_to_end(key)
+                parts[item] = part_cache[key]
+    missing = [item for item in keys if item not in parts]
+    cache_result("figure_part", hits=len(parts), misses=len(missing))
+    if len(missing) > 0:
+        built = build(missing)
+        with lock:
+            for item in missing:
+                part_cache[keys[item]] = built[item]
+            while len(part_cache) > max_parts:
+                part_cache.popitem(last=False)
+        parts.update(built)
+    return parts
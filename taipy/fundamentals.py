@@ -0,0 +1,135 @@
+# %%
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from arrow_files import read_frame, write_frame
+from providers import get_provider
+from constituents import get_constituents
+from metrics import cache_result, count, span
+
+# %% [markdown]
+# Quarterly income statements of the constituents, fetched with bounded concurrency and kept in a
+# persistent per-ticker store with one row per quarter. The quarters returned by each fetch are
+# merged into the stored ones, so the history grows past the few quarters yfinance returns.<br>
+# A ticker is only fetched again once a new quarter is due: its last reported period end plus three
+# months and the filing delay. Building the diluted shares of every constituent then reads local
+# files, except for the companies that have just reported.<br>
+# [yfinance quarterly_income_stmt](https://ranaroussi.github.io/yfinance/reference/api/yfinance.Ticker.html)
+#
+
+# %%
+logger = logging.getLogger(__name__)
+fundamentals_dir = os.environ.get(
+    "SP500_FUNDAMENTALS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "fundamentals"),
+)
+max_workers = int(os.environ.get("SP500_FUNDAMENTALS_WORKERS", 8))
+# Days after a quarter end for the statement to be published (10-Q deadline of large filers):
+filing_delay = pd.Timedelta(days=int(os.environ.get("SP500_FILING_DELAY_DAYS", 40)))
+# Seconds before a ticker whose new quarter is due but not published is asked again:
+recheck_interval = int(os.environ.get("SP500_FUNDAMENTALS_RECHECK", 24 * 60 * 60))
+# Key of the schema metadata holding the time of the last fetch:
+checked_key = b"sp500_checked_at"
+
+
+def statement_path(ticker):
+    return os.path.join(fundamentals_dir, f"{ticker}.arrow")
+
+
+# %%
+def read_statement(ticker):
+    # (quarters×items frame or None, time of the last fetch or None)
+    path = statement_path(ticker)
+    if not os.path.exists(path):
+        return None, None
+    statement, checked_at = read_frame(path, checked_key)
+    return statement, None if checked_at is None else pd.Timestamp(checked_at)
+
+
+def write_statement(ticker, statement):
+    write_frame(statement_path(ticker), statement, checked_key, str(pd.Timestamp.now()))
+
+
+def is_stale(statement, checked_at, now):
+    if checked_at is None:
+        return True
+    if (now - checked_at).total_seconds() < recheck_interval:
+        return False
+    if statement is None or len(statement) == 0:
+        return True  # nothing reported yet, asked again after the recheck interval
+    # The next fiscal quarter ends three months after the last reported one, whatever the fiscal
+    # calendar of the company (e.g. Apple's quarters end on the last Saturday of a month):
+    next_quarter = statement.index.max() + pd.DateOffset(months=3)
+    return now >= next_quarter + filing_delay
+
+
+# %%
+def fetch_statement(ticker):
+    # Quarters×items frame with a float column per line item, e.g. "Diluted Average Shares"
+    with span("income_statement"):
+        statement = get_provider()["income_statement"](ticker)
+    if statement is None or len(statement.columns) == 0:
+        return pd.DataFrame(index=pd.DatetimeIndex([], name="Quarter"))
+    # yfinance returns items×quarters with object columns:
+    statement = statement.transpose().apply(pd.to_numeric, errors="coerce")
+    statement.index = pd.DatetimeIndex(statement.index, name="Quarter")
+    statement.columns = statement.columns.astype(str)
+    return statement
+
+
+def refresh_statement(ticker, cached):
+    try:
+        fetched = fetch_statement(ticker)
+    except Exception as error:
+        # The stored quarters are still served, the next run tries again:
+        logger.warning("Failed to fetch the income statement of %s: %s", ticker, error)
+        count("errors_total", {"task": "fundamentals"})
+        return cached
+    if cached is not None and len(cached) > 0:
+        # The latest fetch wins for the quarters it returns, restatements included:
+        fetched = pd.concat([cached, fetched])
+    fetched = fetched[~fetched.index.duplicated(keep="last")].sort_index()
+    write_statement(ticker, fetched)
+    return fetched
+
+
+def get_statements(tickers=None):
+    # {ticker: quarters×items frame} of the constituents (or of tickers), only the stale ones are
+    # fetched, at most max_workers at the same time
+    if tickers is None:
+        tickers = list(get_constituents()["Symbol"])
+    now = pd.Timestamp.now()
+    statements, stale = {}, []
+    for ticker in tickers:
+        statement, checked_at = read_statement(ticker)
+        statements[ticker] = statement
+        if is_stale(statement, checked_at, now):
+            stale.append(ticker)
+    cache_result("fundamentals", hits=len(tickers) - len(stale), misses=len(stale))
+    if len(stale) > 0:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            refreshed = executor.map(
+                lambda ticker: refresh_statement(ticker, statements[ticker]), stale
+            )
+            statements.update(zip(stale, refreshed))
+    return {
+        ticker: statement
+        for ticker, statement in statements.items()
+        if statement is not None
+    }
+
+
+def diluted_shares(tickers=None, item="Diluted Average Shares"):
+    # Long frame like the notebook's shares_diluted_df: quarter index, item and ticker columns
+    statements = get_statements(tickers)
+    frames = [
+        pd.DataFrame({item: statement[item], "ticker": ticker})
+        for ticker, statement in statements.items()
+        if item in statement.columns
+    ]
+    if len(frames) == 0:
+        return pd.DataFrame(columns=[item, "ticker"], index=pd.DatetimeIndex([]))
+    shares = pd.concat(frames).dropna(subset=item)
+    shares[item] = shares[item].astype("int64")
+    return shares
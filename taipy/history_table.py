@@ -0,0 +1,89 @@
+# %%
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from price_store import to_date
+
+# %% [markdown]
+# Server-side pages of the Historical Data table. The rows of a page are located by position in the
+# history (binary search of the sorted dates, argsort of the filtered rows for the other columns) and
+# only those rows are copied and sent, so opening the table on decades of daily bars or on intraday
+# bars costs one page rather than the whole history.<br>
+# Exports write the rows of the current filter in chunks to a temporary file, CSV or Parquet row
+# groups, instead of building the whole file in memory.<br>
+# [Parquet writer](https://arrow.apache.org/docs/python/generated/pyarrow.parquet.ParquetWriter.html)
+#
+
+# %%
+page_size = int(os.environ.get("SP500_TABLE_PAGE_SIZE", 100))
+export_chunk_rows = int(os.environ.get("SP500_EXPORT_CHUNK_ROWS", 100_000))
+
+
+def row_positions(history, start, end, sort_column, descending):
+    # (first, last, order): the filtered rows are history.iloc[first:last], order is None when they
+    # are sorted by date, otherwise the positions of the filtered rows in sorted order
+    dates = history.index
+    # The date pickers send tz-aware datetimes, the history is tz-naive like the rest of the series:
+    first = 0 if start is None else dates.searchsorted(to_date(start))
+    last = (
+        len(dates)
+        if end is None
+        else dates.searchsorted(to_date(end) + pd.Timedelta(days=1))
+    )
+    last = max(first, last)
+    if sort_column == "Date" or sort_column not in history.columns:
+        return first, last, None
+    values = history[sort_column].to_numpy()[first:last]
+    # Stable sort with the missing values last in both directions:
+    order = np.argsort(-values if descending else values, kind="stable")
+    return first, last, first + order
+
+
+def page_rows(first, last, order, descending, offset, count):
+    # Positions of count rows from offset in the filtered and sorted rows
+    if order is not None:
+        return order[offset : offset + count]
+    if descending:
+        return np.arange(last - 1 - offset, max(first, last - offset - count) - 1, -1)
+    return np.arange(first + offset, min(last, first + offset + count))
+
+
+def get_page(history, page, start, end, sort_column="Date", descending=False):
+    # (rows of the page with a Date column, number of filtered rows, page actually shown)
+    first, last, order = row_positions(history, start, end, sort_column, descending)
+    n_rows = last - first
+    page = min(max(0, page), max(0, -(-n_rows // page_size) - 1))
+    positions = page_rows(first, last, order, descending, page * page_size, page_size)
+    return history.iloc[positions].reset_index(), n_rows, page
+
+
+# %%
+def export_history(history, start, end, sort_column, descending, file_format):
+    # Path of a temporary CSV or Parquet file with the filtered rows, to delete once downloaded
+    first, last, order = row_positions(history, start, end, sort_column, descending)
+    file, path = tempfile.mkstemp(suffix=f".{file_format}", prefix="sp500_history_")
+    os.close(file)
+    writer = None
+    try:
+        try:
+            for offset in range(0, max(1, last - first), export_chunk_rows):
+                rows = history.iloc[
+                    page_rows(first, last, order, descending, offset, export_chunk_rows)
+                ].reset_index()
+                if file_format == "csv":
+                    rows.to_csv(path, mode="a", header=offset == 0, index=False)
+                else:
+                    table = pa.Table.from_pandas(rows, preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(path, table.schema)
+                    writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+    except Exception:
+        os.remove(path)
+        raise
+    return path
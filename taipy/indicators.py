@@ -0,0 +1,121 @@
+# %%
+import numpy as np
+import pandas as pd
+
+# %% [markdown]
+# Technical indicators computed for every ticker at once on a ticker×time matrix: `prices` has
+# (field, ticker) columns such as ("Close", "AAPL"), like `yf.download(group_by="column")`.<br>
+# The returned state keeps the last bars and the running averages so appended bars are updated in
+# O(new bars) with `update_indicators()` instead of recomputing the whole history.<br>
+# [Wilder's smoothing for RSI and ATR](https://en.wikipedia.org/wiki/Average_true_range)
+#
+
+# %%
+indicator_config = {
+    "sma": [50, 200],
+    "ema": [20],
+    "rsi": [14],
+    "bollinger": [20],
+    "atr": [14],
+    "vwap": True,
+}
+bollinger_width = 2
+
+
+def price_matrix(histories):
+    # {ticker: OHLCV frame} -> one frame with (field, ticker) columns
+    return pd.concat(histories, axis=1).swaplevel(axis=1).sort_index(axis=1)
+
+
+def max_window(config):
+    windows = [
+        window
+        for key in ["sma", "ema", "rsi", "bollinger", "atr"]
+        for window in config.get(key, [])
+    ]
+    # One more bar for the previous close of diff() and the true range:
+    return max(windows, default=1) + 1
+
+
+# %%
+def ewm_from(values, alpha, seed):
+    # ewm(adjust=False) continued from the previous average so only the new rows are computed:
+    if seed is None:
+        return values.ewm(alpha=alpha, adjust=False).mean()
+    seeded = pd.DataFrame(np.vstack([seed.to_numpy(), values.to_numpy()]))
+    result = seeded.ewm(alpha=alpha, adjust=False).mean().to_numpy()[1:]
+    return pd.DataFrame(result, index=values.index, columns=values.columns)
+
+
+def compute_indicators(prices, config=indicator_config, state=None):
+    # Returns (indicators, state), indicators having (name, ticker) columns such as ("MA50", "AAPL")
+    if len(prices) == 0:
+        # No bars, e.g. a range without any session: nothing to compute nor to carry on
+        return pd.DataFrame(index=prices.index), state
+    state = {} if state is None else state
+    tail = state.get("tail")
+    extended = prices if tail is None else pd.concat([tail, prices])
+    # Rows of `extended` that are new bars:
+    new_rows = slice(len(extended) - len(prices), None)
+    close = extended["Close"]
+    indicators = {}
+    new_state = {"config": config, "tail": extended.iloc[-max_window(config) :]}
+
+    for window in config.get("sma", []):
+        indicators[f"MA{window}"] = close.rolling(window, min_periods=1).mean()
+    for window in config.get("bollinger", []):
+        mean = close.rolling(window, min_periods=1).mean()
+        std = close.rolling(window, min_periods=1).std()
+        indicators[f"BB{window}_upper"] = mean + bollinger_width * std
+        indicators[f"BB{window}_lower"] = mean - bollinger_width * std
+    # Rolling windows are exact on the stored tail + new bars, keep only the new rows:
+    indicators = {name: values.iloc[new_rows] for name, values in indicators.items()}
+
+    for window in config.get("ema", []):
+        key = f"EMA{window}"
+        indicators[key] = ewm_from(
+            close.iloc[new_rows], 2 / (window + 1), state.get(key)
+        )
+        new_state[key] = indicators[key].iloc[-1]
+    for window in config.get("rsi", []):
+        delta = close.diff().iloc[new_rows]
+        avg_gain = ewm_from(
+            delta.clip(lower=0), 1 / window, state.get(f"RSI{window}_gain")
+        )
+        avg_loss = ewm_from(
+            (-delta).clip(lower=0), 1 / window, state.get(f"RSI{window}_loss")
+        )
+        indicators[f"RSI{window}"] = 100 - 100 / (1 + avg_gain / avg_loss)
+        new_state[f"RSI{window}_gain"] = avg_gain.iloc[-1]
+        new_state[f"RSI{window}_loss"] = avg_loss.iloc[-1]
+    if "High" in extended and "Low" in extended:
+        high, low = extended["High"].iloc[new_rows], extended["Low"].iloc[new_rows]
+        previous_close = close.shift(1).iloc[new_rows]
+        true_range = np.fmax(
+            high - low,
+            np.fmax((high - previous_close).abs(), (low - previous_close).abs()),
+        )
+        for window in config.get("atr", []):
+            key = f"ATR{window}"
+            indicators[key] = ewm_from(true_range, 1 / window, state.get(key))
+            new_state[key] = indicators[key].iloc[-1]
+        if config.get("vwap") and "Volume" in extended:
+            # Anchored at the first loaded bar, cumulative sums carry on across updates:
+            volume = extended["Volume"].iloc[new_rows].fillna(0)
+            typical_volume = ((high + low + close.iloc[new_rows]) / 3 * volume).fillna(
+                0
+            )
+            cumulative_pv = typical_volume.cumsum() + state.get("VWAP_pv", 0)
+            cumulative_volume = volume.cumsum() + state.get("VWAP_volume", 0)
+            indicators["VWAP"] = cumulative_pv / cumulative_volume
+            new_state["VWAP_pv"] = cumulative_pv.iloc[-1]
+            new_state["VWAP_volume"] = cumulative_volume.iloc[-1]
+
+    return pd.concat(indicators, axis=1), new_state
+
+
+def update_indicators(state, new_prices):
+    # Indicator rows for the appended bars only, and the state to use for the next update
+    if len(new_prices) == 0:
+        return pd.DataFrame(index=new_prices.index), state
+    return compute_indicators(new_prices, state["config"], state)
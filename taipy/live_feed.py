@@ -0,0 +1,262 @@
+# %%
+import logging
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+from providers import flat_candles, get_provider, ohlcv_aggregations, read_local_dump
+from price_store import market_tz
+from indicators import compute_indicators, price_matrix, update_indicators
+from metrics import count, span
+
+# %% [markdown]
+# Intraday streaming mode: new bars of the tickers shown live are polled from the provider, or
+# replayed from a recorded feed with `SP500_LIVE_REPLAY`, and appended to a fixed-size ring buffer
+# per ticker. The indicators are updated from the new bars only (`update_indicators`) and stored
+# alongside them, so the cost of a tick does not grow with the time a session has been running.
+# The last bar of a poll can still be in progress: it is polled again and replaced, its indicators
+# taken again from the state before it.<br>
+# Sessions get the new bars through one `broadcast_callback` at most every `SP500_LIVE_PUSH` seconds,
+# however often bars arrive. The recorded feed uses the long layout of the local dumps (Date,
+# Ticker, Open, High, Low, Close, Volume) with a time of day.<br>
+# [Circular buffer](https://en.wikipedia.org/wiki/Circular_buffer)<br>
+# [yfinance intraday history](https://ranaroussi.github.io/yfinance/reference/api/yfinance.Ticker.history.html)
+#
+
+# %%
+logger = logging.getLogger(__name__)
+live_interval = os.environ.get("SP500_LIVE_INTERVAL", "1m")
+# Bars kept per ticker, 5 sessions of 1 minute bars:
+buffer_size = int(os.environ.get("SP500_LIVE_BUFFER", 5 * 390))
+poll_seconds = float(os.environ.get("SP500_LIVE_POLL", 60))
+push_seconds = float(os.environ.get("SP500_LIVE_PUSH", 5))
+replay_path = os.environ.get("SP500_LIVE_REPLAY")
+# Recorded seconds replayed per second:
+replay_speed = float(os.environ.get("SP500_LIVE_REPLAY_SPEED", 60))
+# yfinance serves 1 minute bars for the last 7 days per request:
+initial_lookback = pd.Timedelta(days=7)
+# Tickers no session has asked for within this time stop being polled:
+subscription_ttl = 10 * 60
+
+fields = list(ohlcv_aggregations)
+# {ticker: ring buffer}, {ticker: (indicator state before the last bar, indicator state)},
+# {ticker: last time a session showed it}
+buffers = {}
+indicator_states = {}
+subscriptions = {}
+session_updates = []
+lock = threading.Lock()
+# Set when a ticker is subscribed so its first bars are polled without waiting for the next poll:
+new_subscription = threading.Event()
+
+
+# %%
+def new_buffer(columns, size=buffer_size):
+    return {
+        "columns": columns,
+        "times": np.empty(size, dtype="datetime64[ns]"),
+        "values": np.full((size, len(columns)), np.nan),
+        "next": 0,  # position of the next row written
+        "length": 0,
+    }
+
+
+def append_rows(buffer, times, values):
+    # Overwrites the oldest rows, only the last `size` new rows are written if more arrive at once
+    size = len(buffer["times"])
+    times, values = times[-size:], values[-size:]
+    positions = (buffer["next"] + np.arange(len(times))) % size
+    buffer["times"][positions] = times
+    buffer["values"][positions] = values
+    buffer["next"] = (buffer["next"] + len(times)) % size
+    buffer["length"] = min(size, buffer["length"] + len(times))
+
+
+def buffer_frame(buffer):
+    # Rows from the oldest to the newest, one gather of at most `size` rows
+    size = len(buffer["times"])
+    positions = (buffer["next"] - buffer["length"] + np.arange(buffer["length"])) % size
+    return pd.DataFrame(
+        buffer["values"][positions],
+        index=pd.DatetimeIndex(buffer["times"][positions], name="Date"),
+        columns=buffer["columns"],
+    )
+
+
+def last_time(ticker):
+    buffer = buffers.get(ticker)
+    if buffer is None or buffer["length"] == 0:
+        return None
+    return pd.Timestamp(buffer["times"][(buffer["next"] - 1) % len(buffer["times"])])
+
+
+# %%
+replay_feed = None
+# Monotonic time at which the replay started and first recorded time:
+replay_started = None
+replay_first = None
+replay_positions = {}
+
+
+def get_replay_feed():
+    global replay_feed, replay_started, replay_first
+    with lock:
+        if replay_feed is None:
+            replay_feed = {
+                ticker: flat_candles(prices)
+                for ticker, prices in read_local_dump(
+                    replay_path, intraday=True
+                ).items()
+            }
+            replay_started = time.monotonic()
+            replay_first = min(
+                prices.index[0] for prices in replay_feed.values() if len(prices) > 0
+            )
+    return replay_feed
+
+
+def replay_bars(ticker):
+    # Bars recorded up to the replay clock since the previous call, found from a cursor per ticker
+    prices = get_replay_feed().get(ticker)
+    if prices is None or len(prices) == 0:
+        return prices
+    clock = replay_first + pd.Timedelta(
+        seconds=(time.monotonic() - replay_started) * replay_speed
+    )
+    position = replay_positions.get(ticker, 0)
+    until = position + prices.index[position:].searchsorted(clock, side="right")
+    replay_positions[ticker] = until
+    return prices.iloc[position:until]
+
+
+def poll_bars(ticker):
+    # Bars after the last buffered one, the first request fills the buffer
+    after = last_time(ticker)
+    now = pd.Timestamp.now(tz=market_tz).tz_localize(None)
+    start = now - initial_lookback if after is None else after
+    with span("live_history"):
+        bars = get_provider()["history"](
+            ticker, start, now + pd.Timedelta(days=1), live_interval
+        )
+    if bars.index.tz is not None:
+        bars.index = bars.index.tz_convert(market_tz).tz_localize(None)
+    # The bar in progress at the previous poll comes again with its latest values:
+    return bars if after is None else bars.loc[bars.index >= after]
+
+
+def advance_indicators(state, prices):
+    # None starts from scratch, there was no bar before
+    if state is None:
+        return compute_indicators(prices)
+    return update_indicators(state, prices)
+
+
+def append_bars(ticker, bars):
+    replaced = last_time(ticker) == bars.index[0]
+    before_last, state = indicator_states.get(ticker, (None, None))
+    if replaced:
+        state = before_last
+    prices = price_matrix({ticker: bars[fields]})
+    # The state before the last bar is kept in case the bar was still in progress:
+    if len(prices) > 1:
+        head, before_last = advance_indicators(state, prices.iloc[:-1])
+        last, state = advance_indicators(before_last, prices.iloc[-1:])
+        indicators = pd.concat([head, last])
+    else:
+        before_last = state
+        indicators, state = advance_indicators(state, prices)
+    indicators = indicators.xs(ticker, axis=1, level=1)
+    with lock:
+        indicator_states[ticker] = (before_last, state)
+        if ticker not in buffers:
+            buffers[ticker] = new_buffer(fields + list(indicators.columns))
+        buffer = buffers[ticker]
+        if replaced:
+            # One row back so that the first new row overwrites the last buffered one:
+            buffer["next"] = (buffer["next"] - 1) % len(buffer["times"])
+            buffer["length"] -= 1
+        values = np.column_stack(
+            [bars[fields].to_numpy(dtype=float), indicators.to_numpy(dtype=float)]
+        )
+        append_rows(buffer, bars.index.to_numpy(dtype="datetime64[ns]"), values)
+    count("live_bars_total", {"source": "replay" if replay_path else "poll"}, len(bars))
+
+
+def poll():
+    # New bars of every subscribed ticker, returns whether any arrived
+    now = time.monotonic()
+    with lock:
+        for ticker in [
+            t for t, seen in subscriptions.items() if now - seen > subscription_ttl
+        ]:
+            del subscriptions[ticker]
+            buffers.pop(ticker, None)
+            indicator_states.pop(ticker, None)
+            replay_positions.pop(ticker, None)
+        tickers = list(subscriptions)
+    updated = False
+    for ticker in tickers:
+        try:
+            bars = replay_bars(ticker) if replay_path else poll_bars(ticker)
+        except Exception as error:
+            logger.warning("Failed to poll live bars of %s: %s", ticker, error)
+            count("errors_total", {"task": "live_poll"})
+            continue
+        if bars is not None and len(bars) > 0:
+            append_bars(ticker, bars)
+            updated = True
+    return updated
+
+
+# %%
+def subscribe(tickers):
+    # Called by the sessions showing these tickers live, on every push
+    now = time.monotonic()
+    with lock:
+        added = [ticker for ticker in tickers if ticker not in subscriptions]
+        for ticker in tickers:
+            subscriptions[ticker] = now
+    if len(added) > 0:
+        new_subscription.set()
+
+
+def live_data(tickers):
+    # (close prices, indicators with (name, ticker) columns) of the buffered tickers
+    with lock:
+        frames = {t: buffer_frame(buffers[t]) for t in tickers if t in buffers}
+    if len(frames) == 0:
+        return pd.DataFrame(), None
+    # Tickers without a trade in a minute keep their last price until the next one:
+    frames = pd.concat(frames, axis=1).swaplevel(axis=1).ffill()
+    return frames["Close"], frames.drop(columns=fields, level=0)
+
+
+def register_live_update(update_session):
+    session_updates.append(update_session)
+
+
+def update_sessions(state):
+    for update in session_updates:
+        update(state)
+
+
+def live_loop(gui):
+    last_poll, pending = 0.0, False
+    while True:
+        if new_subscription.is_set() or time.monotonic() - last_poll >= poll_seconds:
+            new_subscription.clear()
+            last_poll = time.monotonic()
+            with span("live_poll"):
+                pending = poll() or pending
+        # Bars arriving between two pushes are sent together with the next one:
+        if pending:
+            pending = False
+            with span("live_push"):
+                gui.broadcast_callback(update_sessions)
+        new_subscription.wait(push_seconds)
+
+
+def start_live_feed(gui):
+    # Idle until a session turns the live mode on
+    threading.Thread(target=live_loop, args=(gui,), daemon=True).start()
@@ -0,0 +1,160 @@
+# %%
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+
+# %% [markdown]
+# Timing spans, histograms and counters of the callbacks, downloads, caches and figure builders,
+# served by `server.py` at `/metrics` in the Prometheus text format. Each gunicorn worker keeps its
+# own metrics, like the caches they describe.<br>
+# [Prometheus exposition format](https://prometheus.io/docs/instrumenting/exposition_formats/)
+#
+
+# %%
+prefix = "sp500"
+time_buckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+bytes_buckets = [2**10, 2**14, 2**17, 2**20, 2**23, 2**26]
+points_buckets = [100, 1000, 10_000, 100_000, 1_000_000]
+
+# {(metric, labels): {"buckets": [...], "counts": [...], "sum": ..., "count": ...}}
+histograms = {}
+# {(metric, labels): value}
+counters = {}
+lock = threading.Lock()
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def observe(metric, labels, value, buckets):
+    with lock:
+        histogram = histograms.setdefault(
+            (metric, label_key(labels)),
+            {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0, "count": 0},
+        )
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                histogram["counts"][i] += 1
+                break
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+def count(metric, labels, value=1):
+    with lock:
+        key = (metric, label_key(labels))
+        counters[key] = counters.get(key, 0) + value
+
+
+def cache_result(cache, hits, misses=0):
+    # Hits and misses of one lookup, or of a batch of lookups
+    if hits > 0:
+        count("cache_requests_total", {"cache": cache, "result": "hit"}, hits)
+    if misses > 0:
+        count("cache_requests_total", {"cache": cache, "result": "miss"}, misses)
+
+
+# %%
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(
+            "span_seconds", {"span": name}, time.perf_counter() - start, time_buckets
+        )
+
+
+def timed(func):
+    # Records every call of func as a span named after it, e.g. as a Taipy callback decorator.
+    # Taipy passes a callback as many arguments as its code declares (__code__.co_argcount), so
+    # the wrapper is generated with the positional parameters of func rather than *args
+    code = func.__code__
+    if code.co_flags & (inspect.CO_VARARGS | inspect.CO_VARKEYWORDS) or (
+        code.co_kwonlyargcount > 0
+    ):
+
+        @functools.wraps(func)
+        def timed_func(*args, **kwargs):
+            with span(func.__name__):
+                return func(*args, **kwargs)
+
+        return timed_func
+    parameters = ", ".join(code.co_varnames[: code.co_argcount])
+    namespace = {}
+    exec(
+        f"def make_timed(timed_wrapped, timed_span):\n"
+        f"    def timed_func({parameters}):\n"
+        f"        with timed_span(timed_wrapped.__name__):\n"
+        f"            return timed_wrapped({parameters})\n"
+        f"    return timed_func\n",
+        namespace,
+    )
+    timed_func = namespace["make_timed"](func, span)
+    timed_func.__defaults__ = func.__defaults__
+    return functools.wraps(func)(timed_func)
+
+
+def figure_points(figure):
+    return sum(len(trace.x) for trace in figure.data if trace.x is not None)
+
+
+# %%
+def format_labels(labels):
+    return ",".join(f'{name}="{value}"' for name, value in labels)
+
+
+def render_metrics():
+    lines = []
+    with lock:
+        histogram_items = sorted(
+            (key, dict(value, counts=list(value["counts"])))
+            for key, value in histograms.items()
+        )
+        counter_items = sorted(counters.items())
+    for metric in sorted({metric for (metric, _), _ in histogram_items}):
+        lines.append(f"# TYPE {prefix}_{metric} histogram")
+        for (name, labels), histogram in histogram_items:
+            if name != metric:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(histogram["buckets"], histogram["counts"]):
+                cumulative += bucket_count
+                bucket_labels = format_labels(labels + (("le", bound),))
+                lines.append(
+                    f"{prefix}_{metric}_bucket{{{bucket_labels}}} {cumulative}"
+                )
+            bucket_labels = format_labels(labels + (("le", "+Inf"),))
+            lines.append(
+                f"{prefix}_{metric}_bucket{{{bucket_labels}}} {histogram['count']}"
+            )
+            lines.append(
+                f"{prefix}_{metric}_sum{{{format_labels(labels)}}} {histogram['sum']}"
+            )
+            lines.append(
+                f"{prefix}_{metric}_count{{{format_labels(labels)}}} {histogram['count']}"
+            )
+    for metric in sorted({metric for (metric, _), _ in counter_items}):
+        lines.append(f"# TYPE {prefix}_{metric} counter")
+        for (name, labels), value in counter_items:
+            if name == metric:
+                lines.append(f"{prefix}_{metric}{{{format_labels(labels)}}} {value}")
+    # Hit ratio of every cache, derived from the counters for a quick look without a query:
+    requests = {}
+    for (name, labels), value in counter_items:
+        if name == "cache_requests_total":
+            labels = dict(labels)
+            hits, total = requests.get(labels["cache"], (0, 0))
+            requests[labels["cache"]] = (
+                hits + (value if labels["result"] == "hit" else 0),
+                total + value,
+            )
+    if len(requests) > 0:
+        lines.append(f"# TYPE {prefix}_cache_hit_ratio gauge")
+        for cache, (hits, total) in sorted(requests.items()):
+            lines.append(f'{prefix}_cache_hit_ratio{{cache="{cache}"}} {hits / total}')
+    return "\n".join(lines) + "\n"
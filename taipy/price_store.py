@@ -0,0 +1,202 @@
+# %%
+import os
+import pandas as pd
+from pandas.tseries.holiday import (
+    AbstractHolidayCalendar,
+    DateOffset,
+    GoodFriday,
+    Holiday,
+    MO,
+    USLaborDay,
+    USMemorialDay,
+    USPresidentsDay,
+    USThanksgivingDay,
+    nearest_workday,
+    sunday_to_monday,
+)
+from pandas.tseries.offsets import CustomBusinessDay
+from arrow_files import read_frame, read_metadata, write_frame
+from metrics import cache_result
+
+# %% [markdown]
+# Persistent per-ticker, per-interval price store shared by every restart and every gunicorn worker.<br>
+# Files are uncompressed Arrow IPC (Feather v2) so they can be memory-mapped on read instead of parsed.<br>
+# A date range is only marked as covered once a download returned bars for it, or when it has no
+# trading session at all: an empty download can also be a transient error or a rate limit.<br>
+# [Feather / Arrow IPC file format](https://arrow.apache.org/docs/python/feather.html)<br>
+# [NYSE holidays](https://www.nyse.com/markets/hours-calendars)
+#
+
+# %%
+store_dir = os.environ.get(
+    "SP500_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "prices"),
+)
+# Key of the schema metadata holding the date ranges the file covers:
+coverage_key = b"sp500_coverage"
+market_tz = "America/New_York"
+market_close = pd.Timedelta(hours=16)
+ohlcv_columns = ["Open", "High", "Low", "Close", "Volume"]
+
+
+class ExchangeCalendar(AbstractHolidayCalendar):
+    # Full-day NYSE closures, the exceptional ones (e.g. national days of mourning) are not listed
+    rules = [
+        Holiday("New Year's Day", month=1, day=1, observance=sunday_to_monday),
+        Holiday(
+            "Martin Luther King Jr. Day",
+            start_date="1998-01-01",
+            month=1,
+            day=1,
+            offset=DateOffset(weekday=MO(3)),
+        ),
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday(
+            "Juneteenth",
+            start_date="2022-01-01",
+            month=6,
+            day=19,
+            observance=nearest_workday,
+        ),
+        Holiday("Independence Day", month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday("Christmas Day", month=12, day=25, observance=nearest_workday),
+    ]
+
+
+session_day = CustomBusinessDay(calendar=ExchangeCalendar())
+
+
+def store_path(ticker, interval):
+    return os.path.join(store_dir, interval, f"{ticker}.arrow")
+
+
+def to_date(value):
+    return pd.Timestamp(value).normalize().tz_localize(None)
+
+
+def last_session(end):
+    # Map any end date to the last completed trading session so that cache lookups stay stable
+    # for the whole day instead of changing with pd.Timestamp.today():
+    now = pd.Timestamp.now(tz=market_tz).tz_localize(None)
+    today = now.normalize()
+    end = min(to_date(end), today)
+    # Today's bar is only complete once the market has closed:
+    if end == today and now - today < market_close:
+        end -= pd.DateOffset(1)
+    # Roll weekends and exchange holidays back to the previous session:
+    return session_day.rollback(end)
+
+
+def has_sessions(start, end):
+    # Whether the exchange opened between start and end (inclusive), i.e. whether bars are expected
+    return len(pd.date_range(start, end, freq=session_day)) > 0
+
+
+# %%
+def merge_ranges(ranges):
+    # Union of [start, end] date ranges, joining ranges that overlap or touch:
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + pd.DateOffset(1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def missing_ranges(coverage, start, end):
+    # Sub-ranges of [start, end] that are not covered yet:
+    missing = []
+    for covered_start, covered_end in coverage:
+        if covered_end < start:
+            continue
+        if covered_start > end:
+            break
+        if covered_start > start:
+            missing.append((start, covered_start - pd.DateOffset(1)))
+        start = max(start, covered_end + pd.DateOffset(1))
+    if start <= end:
+        missing.append((start, end))
+    return missing
+
+
+# %%
+def read_coverage(ticker, interval):
+    path = store_path(ticker, interval)
+    if not os.path.exists(path):
+        return []
+    coverage = read_metadata(path, coverage_key)
+    if coverage is None:
+        return []
+    return [(to_date(start), to_date(end)) for start, end in coverage]
+
+
+def read_prices(ticker, interval):
+    path = store_path(ticker, interval)
+    if not os.path.exists(path):
+        return None
+    return read_frame(path, coverage_key)[0]
+
+
+def write_prices(ticker, interval, prices, coverage):
+    coverage = [[str(start), str(end)] for start, end in coverage]
+    write_frame(store_path(ticker, interval), prices, coverage_key, coverage)
+
+
+# %%
+def empty_history():
+    return pd.DataFrame(
+        columns=ohlcv_columns, index=pd.DatetimeIndex([], name="Date"), dtype=float
+    )
+
+
+def is_cached(ticker, interval, start, end):
+    start, end = to_date(start), last_session(end)
+    # No session has closed in the range yet (a weekend, or today before the close), the pages
+    # fetch it in the background like any other miss:
+    if start > end:
+        return False
+    coverage = read_coverage(ticker, interval)
+    return len(missing_ranges(coverage, start, end)) == 0
+
+
+def get_history(ticker, start, end, interval, download):
+    # Read from the store first and only call `download(start, end)` for the date gaps that are
+    # not covered yet. `end` is inclusive here while `download` takes an exclusive end like yfinance.
+    start, end = to_date(start), last_session(end)
+    coverage = read_coverage(ticker, interval)
+    prices = read_prices(ticker, interval) if len(coverage) > 0 else None
+    gaps = missing_ranges(coverage, start, end)
+    cache_result("price_store", hits=int(len(gaps) == 0), misses=int(len(gaps) > 0))
+    if len(gaps) > 0:
+        downloads = [download(gap[0], gap[1] + pd.DateOffset(1)) for gap in gaps]
+        fetched_data = [data for data in downloads if len(data) > 0]
+        # A gap that came back empty although the exchange was open stays missing and is asked
+        # again by the next request:
+        covered = [
+            gap
+            for gap, data in zip(gaps, downloads)
+            if len(data) > 0 or not has_sessions(*gap)
+        ]
+        if prices is None and len(fetched_data) == 0:
+            # Nothing stored or found: leave the store untouched and return the empty download
+            return downloads[0]
+        for data in fetched_data:
+            # Keep a tz-naive index so histories from different sources can be concatenated:
+            if data.index.tz is not None:
+                data.index = data.index.tz_localize(None)
+        if len(covered) > 0:
+            if prices is not None:
+                fetched_data.insert(0, prices)
+            # Merge new bars in, the latest download wins where a bar was already stored:
+            prices = pd.concat(fetched_data)
+            prices = prices[~prices.index.duplicated(keep="last")].sort_index()
+            write_prices(ticker, interval, prices, merge_ranges(coverage + covered))
+    if prices is None:
+        # Nothing stored and no session closed in the range, so nothing to download either:
+        return empty_history()
+    return prices.loc[start : end + pd.DateOffset(1) - pd.Timedelta(1)]
@@ -0,0 +1,263 @@
+# %%
+import os
+import threading
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.feather as feather
+import yfinance as yf
+from price_store import get_history, is_cached, market_tz, to_date
+from ticker_metadata import provider_symbol
+from metrics import count, observe, bytes_buckets, span
+
+# %% [markdown]
+# Market-data providers behind the pages, selected with `SP500_PROVIDER`. A provider is a dict of
+# functions: `history(ticker, start, end, interval)` with an exclusive end like yfinance,
+# `bulk_history(tickers, start, end, interval)` returning `{ticker: prices}`, `market_cap(ticker)` and
+# `income_statement(ticker)` (items×quarters like yfinance).<br>
+# The local provider reads a CSV/Parquet/Arrow dump once (typed columns, dates parsed once) so the
+# dashboards and the benchmarks can run without network. Two layouts are read:
+# - wide close prices, a Date column then one column per ticker, as saved by the notebooks
+#   (`stock_price_max.csv`, `stock_price_2024.csv`)
+# - long OHLCV, with Date, Ticker, Open, High, Low, Close and Volume columns
+#
+
+# %%
+provider_name = os.environ.get("SP500_PROVIDER", "yfinance")
+local_path = os.environ.get("SP500_LOCAL_DATA", "stock_price_max.csv")
+# Format of the dump dates when they are not ISO 8601, e.g. "%d/%m/%Y":
+local_date_format = os.environ.get("SP500_LOCAL_DATE_FORMAT")
+
+# yfinance interval -> pandas resampling rule, bars are labelled by their first day like yfinance.
+# Coarser bars are aggregated from the daily bars instead of downloaded:
+interval_rules = {"1d": None, "5d": "5B", "1wk": "W-MON", "1mo": "MS", "3mo": "3MS"}
+ohlcv_aggregations = {
+    "Open": "first",
+    "High": "max",
+    "Low": "min",
+    "Close": "last",
+    "Volume": "sum",
+}
+
+
+def source_interval(interval):
+    # Interval of the bars actually fetched for the requested interval
+    return "1d" if interval_rules.get(interval) is not None else interval
+
+
+def resample_bars(prices, interval):
+    # Bars of one ticker (OHLCV columns) or of many at once ((field, ticker) columns), each field
+    # aggregated for all the tickers in one call. Derived columns such as moving averages are not
+    # aggregated, they are computed again on the resampled bars.
+    rule = interval_rules.get(interval)
+    if rule is None or len(prices) == 0:
+        return prices
+    fields = prices.columns.get_level_values(0)
+    aggregations = fields.map(lambda field: ohlcv_aggregations.get(field, "last"))
+    resampled = pd.concat(
+        [
+            prices.loc[:, aggregations == aggregation]
+            .resample(rule, closed="left", label="left")
+            .agg(aggregation)
+            for aggregation in aggregations.unique()
+        ],
+        axis=1,
+    )[prices.columns]
+    # Periods without any session (holidays) are dropped instead of kept as empty bars:
+    sessions = prices.index.to_series().resample(rule, closed="left", label="left")
+    return resampled[sessions.count().to_numpy() > 0]
+
+
+# %%
+def yfinance_history(ticker, start, end, interval):
+    # Ticker.history is used rather than yf.download because yf.download collects its results in
+    # module-global dicts, so several downloads running in parallel threads overwrite each other.
+    return yf.Ticker(provider_symbol(ticker)).history(
+        start=start, end=end, interval=interval, actions=False
+    )
+
+
+def yfinance_bulk_history(tickers, start, end, interval):
+    # One request for all the tickers, split back into {ticker: prices}. Only call it from one thread.
+    symbols = {ticker: provider_symbol(ticker) for ticker in tickers}
+    data = yf.download(
+        list(symbols.values()),
+        start=start,
+        end=end,
+        interval=interval,
+        group_by="ticker",
+        auto_adjust=True,  # same prices as Ticker.history()
+        actions=False,
+        progress=False,
+    )
+    if data.index.tz is not None:
+        data.index = data.index.tz_localize(None)
+    bulk = {}
+    for ticker, symbol in symbols.items():
+        if symbol in data.columns.get_level_values(0):
+            # Rows of the other tickers' sessions are all NaN for this one:
+            bulk[ticker] = data[symbol].dropna(how="all")
+        else:
+            bulk[ticker] = data.iloc[:0]
+    return bulk
+
+
+def yfinance_market_cap(ticker):
+    # fast_info derives the market cap from shares outstanding and last price without loading .info:
+    return yf.Ticker(provider_symbol(ticker)).fast_info["marketCap"]
+
+
+def yfinance_income_statement(ticker):
+    # The normalized symbol replaces the notebook's KeyError retry with a dash-normalized ticker:
+    return yf.Ticker(provider_symbol(ticker)).quarterly_income_stmt
+
+
+# %%
+local_prices = None
+lock = threading.Lock()
+
+
+def parse_dates(dates, intraday=False):
+    # The whole column is parsed in one call. Dumps written from yfinance carry UTC offsets that
+    # change with daylight saving time, they are read in UTC then converted back to New York dates
+    # (or New York times for intraday bars):
+    first = pd.to_datetime(dates.iloc[:1], format=local_date_format)
+    if first.dt.tz is None:
+        return pd.DatetimeIndex(pd.to_datetime(dates, format=local_date_format))
+    dates = pd.to_datetime(dates, format=local_date_format, utc=True)
+    dates = pd.DatetimeIndex(dates).tz_convert(market_tz).tz_localize(None)
+    return dates if intraday else dates.normalize()
+
+
+def read_local_dump(path, intraday=False):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        columns = pd.read_csv(path, nrows=0).columns
+        # Typed columns given to the multithreaded Arrow parser instead of inferred, the dates are
+        # kept as text to be parsed once below:
+        column_types = {column: pa.float64() for column in columns}
+        column_types["Date"] = pa.string()
+        column_types["Ticker"] = pa.dictionary(pa.int32(), pa.string())
+        dump = pa_csv.read_csv(
+            path,
+            convert_options=pa_csv.ConvertOptions(
+                column_types={column: column_types[column] for column in columns}
+            ),
+        ).to_pandas()
+    elif extension == ".parquet":
+        dump = pd.read_parquet(path)
+    else:
+        dump = feather.read_table(path, memory_map=True).to_pandas()
+    if "Date" in dump.columns:
+        dump = dump.set_index("Date")
+    if not isinstance(dump.index, pd.DatetimeIndex):
+        dump.index = parse_dates(pd.Series(dump.index), intraday)
+    elif dump.index.tz is not None:
+        dump.index = dump.index.tz_convert(market_tz).tz_localize(None)
+        if not intraday:
+            dump.index = dump.index.normalize()
+    dump.index.name = "Date"
+    if "Ticker" in dump.columns:
+        return {
+            ticker: prices.drop(columns="Ticker").sort_index()
+            for ticker, prices in dump.groupby("Ticker", observed=True, sort=False)
+        }
+    # Close prices only, kept as series until a ticker is requested:
+    dump = dump.sort_index()
+    return {ticker: dump[ticker].dropna() for ticker in dump.columns}
+
+
+def get_local_prices():
+    global local_prices
+    with lock:
+        if local_prices is None:
+            local_prices = read_local_dump(local_path)
+    return local_prices
+
+
+def flat_candles(prices):
+    # A close-only dump gives flat candles and no volume:
+    if isinstance(prices, pd.Series):
+        return pd.DataFrame(
+            {
+                "Open": prices,
+                "High": prices,
+                "Low": prices,
+                "Close": prices,
+                "Volume": 0,
+            }
+        )
+    return prices
+
+
+def local_history(ticker, start, end, interval):
+    prices = get_local_prices().get(ticker)
+    if prices is None:
+        return pd.DataFrame(columns=list(ohlcv_aggregations), dtype=float)
+    prices = prices.loc[to_date(start) : to_date(end) - pd.Timedelta(1)]
+    return resample_bars(flat_candles(prices), interval)
+
+
+def local_bulk_history(tickers, start, end, interval):
+    return {ticker: local_history(ticker, start, end, interval) for ticker in tickers}
+
+
+def local_constituents():
+    # Stands in for the Wikipedia table when running offline from a dump:
+    symbols = sorted(get_local_prices())
+    return pd.DataFrame({"Symbol": symbols, "Security": symbols})
+
+
+# %%
+# "store": whether downloads go through the on-disk price store, a local dump is read directly
+providers = {
+    "yfinance": {
+        "history": yfinance_history,
+        "bulk_history": yfinance_bulk_history,
+        "market_cap": yfinance_market_cap,
+        "income_statement": yfinance_income_statement,
+        "store": True,
+    },
+    "local": {
+        "history": local_history,
+        "bulk_history": local_bulk_history,
+        "market_cap": lambda ticker: 0,
+        # Price dumps carry no fundamentals:
+        "income_statement": lambda ticker: pd.DataFrame(),
+        "store": False,
+    },
+}
+
+
+def get_provider():
+    return providers[provider_name]
+
+
+def get_prices(ticker, start, end, interval):
+    # Prices from start to end (inclusive) from the selected provider
+    provider = get_provider()
+    if source_interval(interval) != interval:
+        # Aggregated from the daily bars so an interval switch reads what is already stored:
+        return resample_bars(get_prices(ticker, start, end, "1d"), interval)
+
+    def download(start, end):
+        with span(f"{provider_name}.history"):
+            prices = provider["history"](ticker, start, end, interval)
+        fetched_bytes = int(prices.memory_usage(index=True).sum())
+        observe(
+            "fetched_bytes", {"provider": provider_name}, fetched_bytes, bytes_buckets
+        )
+        count("fetched_bytes_total", {"provider": provider_name}, fetched_bytes)
+        return prices
+
+    if not provider["store"]:
+        return download(start, to_date(end) + pd.DateOffset(1))
+    # Read from the on-disk price store first, the provider is only hit on a miss:
+    return get_history(ticker, start, end, interval, download)
+
+
+def is_available(ticker, interval, start, end):
+    # Whether get_prices() can answer without a download
+    return not get_provider()["store"] or is_cached(
+        ticker, source_interval(interval), start, end
+    )
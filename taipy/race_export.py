@@ -0,0 +1,329 @@
+# %%
+import hashlib
+import itertools
+import multiprocessing
+import os
+import subprocess
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import plotly.graph_objects as go
+from race_frames import race_frames
+from figure_cache import data_version
+from metrics import cache_result, span
+
+# %% [markdown]
+# Export of bar chart races (see `race_frames.py`) as cached files served by `server.py` at
+# `/animations/<name>`, so a race is rendered once rather than on every request.<br>
+# - HTML: a Plotly figure whose frames only carry the on-screen bars (values, positions and labels,
+#   rounded), not the whole universe nor the layout, and which loads one `plotly.min.js` shared by
+#   every animation of the directory instead of embedding the bundle.
+# - MP4 / GIF: chunks of frames are drawn with Matplotlib in a process pool and the raw images are
+#   piped in order to ffmpeg. Matplotlib and the ffmpeg binary are only needed for these formats,
+#   like in the notebooks. The workers are spawned rather than forked from the server, whose
+#   threads may hold locks that a forked child would inherit locked.<br>
+# Renders of different races run concurrently, a second request for the same race waits for the
+# first one. The directory is kept under a disk budget by removing the least recently served
+# files.<br>
+# [Plotly animations](https://plotly.com/python/animations/)<br>
+# [ffmpeg rawvideo input](https://ffmpeg.org/ffmpeg-formats.html#rawvideo)
+#
+
+# %%
+animation_dir = os.environ.get(
+    "SP500_ANIMATION_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "animations"),
+)
+max_workers = int(os.environ.get("SP500_RENDER_WORKERS", os.cpu_count() or 1))
+disk_budget = int(os.environ.get("SP500_ANIMATION_BUDGET_MB", 1024)) * 2**20
+# Frames drawn by a worker per task:
+chunk_frames = 50
+palette_size = 20
+lock = threading.Lock()
+# One lock per animation being rendered, guarded by lock:
+render_locks = {}
+
+
+def animation_name(data, file_format, options):
+    # Same data and options, same file: the name is a digest of both
+    key = repr((data_version(data), file_format, sorted(options.items())))
+    return f"race_{hashlib.sha1(key.encode()).hexdigest()[:16]}.{file_format}"
+
+
+def period_label(period):
+    return period.strftime("%d/%m/%Y") if hasattr(period, "strftime") else str(period)
+
+
+def ticker_color(ticker, colors):
+    # Stable across processes and runs, unlike hash():
+    return colors[zlib.crc32(ticker.encode()) % len(colors)]
+
+
+# %%
+def race_figure(data, n_bars, steps_per_period, frame_duration, title):
+    colors = [
+        f"hsl({int(hue)},60%,45%)"
+        for hue in np.linspace(0, 360, palette_size, endpoint=False)
+    ]
+    frames = []
+    for i, frame in enumerate(race_frames(data, n_bars, steps_per_period)):
+        frames.append(
+            {
+                "name": str(i),
+                "data": [
+                    {
+                        "x": np.round(frame["values"], 2),
+                        "y": np.round(frame["positions"], 3),
+                        "text": frame["tickers"],
+                        "marker": {
+                            "color": [
+                                ticker_color(ticker, colors)
+                                for ticker in frame["tickers"]
+                            ]
+                        },
+                    }
+                ],
+                "traces": [0],
+                # Only the period label and the value axis change in the layout:
+                "layout": {
+                    "annotations": [{"text": period_label(frame["period"])}],
+                    "xaxis": {
+                        "range": [0, 1.05 * np.nanmax(frame["values"], initial=0)]
+                    },
+                },
+            }
+        )
+    first = frames[0]["data"][0] if len(frames) > 0 else {}
+    layout = {
+        "title": {"text": title},
+        "xaxis": frames[0]["layout"]["xaxis"] if frames else {},
+        # Position 0 is the top bar:
+        "yaxis": {"range": [n_bars - 0.5, -0.5], "visible": False},
+        "annotations": [
+            {
+                "text": frames[0]["layout"]["annotations"][0]["text"] if frames else "",
+                "xref": "paper",
+                "yref": "paper",
+                "x": 0.98,
+                "y": 0.05,
+                "showarrow": False,
+                "font": {"size": 24},
+            }
+        ],
+        "updatemenus": [
+            {
+                "type": "buttons",
+                "showactive": False,
+                "buttons": [
+                    {
+                        "label": "Play",
+                        "method": "animate",
+                        "args": [
+                            None,
+                            {
+                                "frame": {"duration": frame_duration, "redraw": False},
+                                "transition": {"duration": frame_duration},
+                                "fromcurrent": True,
+                            },
+                        ],
+                    },
+                    {
+                        "label": "Pause",
+                        "method": "animate",
+                        "args": [
+                            [None],
+                            {"frame": {"duration": 0}, "mode": "immediate"},
+                        ],
+                    },
+                ],
+            }
+        ],
+    }
+    trace = {
+        "type": "bar",
+        "orientation": "h",
+        "textposition": "inside",
+        "hovertemplate": "%{text}: %{x:,.2f}<extra></extra>",
+        **first,
+    }
+    return go.Figure(data=[trace], layout=layout, frames=frames, _validate=False)
+
+
+def write_html(path, data, n_bars, steps_per_period, frame_duration, title):
+    figure = race_figure(data, n_bars, steps_per_period, frame_duration, title)
+    # "directory" writes plotly.min.js next to the file once and every animation links to it:
+    figure.write_html(
+        path,
+        include_plotlyjs="directory",
+        full_html=True,
+        auto_play=False,
+        validate=False,
+    )
+
+
+# %%
+def render_chunk(frames, n_bars, size, dpi, title):
+    # Raw RGBA images of a chunk of frames, run in the worker processes
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    colors = plt.get_cmap("viridis", palette_size).colors
+    figure, ax = plt.subplots(figsize=(size[0] / dpi, size[1] / dpi), dpi=dpi)
+    images = []
+    for frame in frames:
+        ax.clear()
+        ax.barh(
+            frame["positions"],
+            frame["values"],
+            color=[ticker_color(ticker, colors) for ticker in frame["tickers"]],
+        )
+        for position, value, ticker in zip(
+            frame["positions"], frame["values"], frame["tickers"]
+        ):
+            ax.text(value, position, f" {ticker} {value:,.0f}", va="center")
+        ax.set_ylim(n_bars - 0.5, -0.5)
+        ax.set_yticks([])
+        ax.set_title(title)
+        ax.text(
+            0.98,
+            0.05,
+            period_label(frame["period"]),
+            transform=ax.transAxes,
+            ha="right",
+            size=20,
+        )
+        figure.canvas.draw()
+        images.append(bytes(figure.canvas.buffer_rgba()))
+    plt.close(figure)
+    return images
+
+
+def write_video(path, data, n_bars, steps_per_period, fps, size, dpi, title):
+    # Chunks are drawn in parallel and written in order, with a bounded number of chunks in flight
+    if path.endswith(".gif"):
+        # One palette for the whole GIF, computed by ffmpeg from the frames:
+        output = ["-vf", "split[a][b];[a]palettegen[p];[b][p]paletteuse", "-loop", "0"]
+    else:
+        output = ["-vcodec", "libx264", "-pix_fmt", "yuv420p"]
+    encoder = subprocess.Popen(
+        ["ffmpeg", "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgba"]
+        + ["-s", f"{size[0]}x{size[1]}", "-r", str(fps), "-i", "-"]
+        + output
+        + [path],
+        stdin=subprocess.PIPE,
+    )
+    frames = race_frames(data, n_bars, steps_per_period)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            pending = deque()
+            while True:
+                while len(pending) < 2 * max_workers:
+                    chunk = list(itertools.islice(frames, chunk_frames))
+                    if len(chunk) == 0:
+                        break
+                    pending.append(
+                        executor.submit(render_chunk, chunk, n_bars, size, dpi, title)
+                    )
+                if len(pending) == 0:
+                    break
+                for image in pending.popleft().result():
+                    encoder.stdin.write(image)
+    finally:
+        encoder.stdin.close()
+        encoder.wait()
+    if encoder.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to encode {path}")
+
+
+# %%
+def prune_animations(keep):
+    # Remove the least recently served animations until the directory fits the disk budget
+    files = []
+    for entry in os.scandir(animation_dir):
+        if entry.name.startswith("race_") and entry.name != keep:
+            files.append((entry.stat().st_mtime, entry.stat().st_size, entry.path))
+    used = sum(size for _, size, _ in files)
+    used += os.path.getsize(os.path.join(animation_dir, keep))
+    for _, size, path in sorted(files):
+        if used <= disk_budget:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Already removed by another worker:
+            pass
+        used -= size
+
+
+def get_animation(
+    data,
+    file_format="html",
+    n_bars=10,
+    steps_per_period=10,
+    frame_duration=100,
+    size=(800, 450),
+    dpi=100,
+    title="",
+):
+    # Name of the cached animation of the periods×tickers frame data, rendered on the first request
+    options = {
+        "n_bars": n_bars,
+        "steps_per_period": steps_per_period,
+        "frame_duration": frame_duration,
+        "size": tuple(size),
+        "dpi": dpi,
+        "title": title,
+    }
+    name = animation_name(data, file_format, options)
+    path = os.path.join(animation_dir, name)
+    try:
+        # The modification time is the last use for the pruning:
+        os.utime(path)
+        cache_result("animation", hits=1)
+        return name
+    except FileNotFoundError:
+        pass
+    with lock:
+        render_lock = render_locks.setdefault(name, threading.Lock())
+    with render_lock:
+        found = os.path.exists(path)
+        cache_result("animation", hits=int(found), misses=int(not found))
+        if not found:
+            os.makedirs(animation_dir, exist_ok=True)
+            tmp_path = os.path.join(animation_dir, f"tmp_{os.getpid()}_{name}")
+            try:
+                with span(f"render_{file_format}"):
+                    if file_format == "html":
+                        write_html(
+                            tmp_path,
+                            data,
+                            n_bars,
+                            steps_per_period,
+                            frame_duration,
+                            title,
+                        )
+                    else:
+                        write_video(
+                            tmp_path,
+                            data,
+                            n_bars,
+                            steps_per_period,
+                            1000 / frame_duration,
+                            size,
+                            dpi,
+                            title,
+                        )
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            prune_animations(name)
+        with lock:
+            render_locks.pop(name, None)
+    return name
@@ -0,0 +1,85 @@
+# %%
+import numpy as np
+import pandas as pd
+
+# %% [markdown]
+# Frames of bar chart races: the top `n_bars` tickers of every period, with the values and the bar
+# positions interpolated between periods so that bars slide past each other.<br>
+# The ranks of all the periods are computed in one pass over the periods×tickers matrix
+# (`np.argpartition` then a sort of the top k only), instead of filtering and sorting a frame per
+# period. The interpolated steps are generated lazily from two rows of the matrix so that a
+# renderer can consume long multi-year races without holding every step in memory.<br>
+# [numpy.argpartition](https://numpy.org/doc/stable/reference/generated/numpy.argpartition.html)<br>
+# [bar_chart_race](https://www.dexplo.org/bar_chart_race/)
+#
+
+
+# %%
+def race_matrix(data, value_column=None, ticker_column="ticker"):
+    # Periods×tickers frame from wide prices (one column per ticker, e.g. stock_price_max.csv) or
+    # long rows such as the notebooks' shares_diluted_df (period index, ticker and value columns)
+    if ticker_column in data.columns:
+        data = data.pivot_table(
+            index=data.index, columns=ticker_column, values=value_column, aggfunc="last"
+        )
+    return data.sort_index()
+
+
+def rank_periods(values, n_bars):
+    # (top, ranks): top[p] holds the columns of the n_bars largest values of period p in
+    # descending order, ranks[p, column] their place (0 is the top) and n_bars for the rest
+    n_periods, n_tickers = values.shape
+    n_bars = min(n_bars, n_tickers)
+    # Missing values are never ranked:
+    values = np.where(np.isnan(values), -np.inf, values)
+    top = np.argpartition(-values, n_bars - 1, axis=1)[:, :n_bars]
+    rows = np.arange(n_periods)[:, None]
+    top = top[rows, np.argsort(-values[rows, top], axis=1, kind="stable")]
+    # Tickers without a value in a period are not shown even if fewer than n_bars have one:
+    top_values = values[rows, top]
+    ranks = np.full((n_periods, n_tickers), float(n_bars))
+    ranks[rows, top] = np.where(np.isinf(top_values), n_bars, np.arange(n_bars))
+    return top, ranks
+
+
+def race_frames(data, n_bars=10, steps_per_period=10):
+    # Generator of the frames of a race over a periods×tickers frame (see race_matrix), each frame
+    # being {"period", "step", "tickers", "values", "positions"} with the bars in position order
+    labels, tickers = data.index, data.columns.to_numpy()
+    values = data.to_numpy(dtype=float)
+    n_bars = min(n_bars, len(tickers))
+    top, ranks = rank_periods(values, n_bars)
+    steps = np.arange(steps_per_period) / steps_per_period
+    for period in range(len(values)):
+        last = period == len(values) - 1
+        following = period if last else period + 1
+        # Only the bars shown at either end of the period can be on screen in between:
+        columns = np.union1d(top[period], top[following])
+        start_values = values[period, columns]
+        end_values = values[following, columns]
+        # A bar entering the chart grows from its end value rather than from a missing one:
+        start_values = np.where(np.isnan(start_values), end_values, start_values)
+        end_values = np.where(np.isnan(end_values), start_values, end_values)
+        for step, t in enumerate(steps[:1] if last else steps):
+            positions = (1 - t) * ranks[period, columns] + t * ranks[following, columns]
+            shown = positions < n_bars
+            order = np.argsort(positions[shown], kind="stable")
+            yield {
+                "period": labels[period],
+                "step": step,
+                "tickers": tickers[columns[shown][order]],
+                "values": ((1 - t) * start_values + t * end_values)[shown][order],
+                "positions": positions[shown][order],
+            }
+
+
+def top_frames(data, n_bars=10):
+    # Generator of (period, top n_bars values in descending order), the vectorized form of the
+    # notebooks' loc[index == frame].sort_values(...).head(10), e.g. as FuncAnimation frames
+    values = data.to_numpy(dtype=float)
+    tickers = data.columns.to_numpy()
+    n_bars = min(n_bars, len(tickers))
+    top, ranks = rank_periods(values, n_bars)
+    for period, label in enumerate(data.index):
+        shown = top[period][ranks[period, top[period]] < n_bars]
+        yield label, pd.Series(values[period, shown], index=tickers[shown])
@@ -0,0 +1,71 @@
+# %%
+import numpy as np
+import pandas as pd
+
+# %% [markdown]
+# Range min/max index answering the y-axis limits of any `[x0, x1]` date range in O(1), built once per
+# fetched series instead of scanning the frame for every preset button or zoom.<br>
+# [Sparse table for range minimum queries](https://cp-algorithms.com/data_structures/sparse-table.html)
+#
+
+
+# %%
+def sparse_table(values, func):
+    # Level k holds func() over the 2**k values starting at each position:
+    levels = [values]
+    width = 1
+    while 2 * width <= len(values):
+        previous = levels[-1]
+        levels.append(func(previous[:-width], previous[width:]))
+        width *= 2
+    return levels
+
+
+def query_sparse_table(levels, func, i, j):
+    # Two overlapping power-of-two windows cover [i, j] (inclusive) exactly:
+    k = (j - i + 1).bit_length() - 1
+    return func(levels[k][i], levels[k][j - (1 << k) + 1])
+
+
+# %%
+def build_range_index(stock_history):
+    # fmin/fmax ignore the NaN of moving averages or missing bars:
+    prices = stock_history.drop(columns="Volume").to_numpy(dtype=float)
+    volume = stock_history["Volume"].to_numpy(dtype=float)
+    return {
+        "dates": stock_history.index.to_numpy(dtype="datetime64[ns]"),
+        "price_min": sparse_table(
+            np.fmin.reduce(prices, axis=1, initial=np.nan), np.fmin
+        ),
+        "price_max": sparse_table(
+            np.fmax.reduce(prices, axis=1, initial=np.nan), np.fmax
+        ),
+        "volume_min": sparse_table(volume, np.fmin),
+        "volume_max": sparse_table(volume, np.fmax),
+    }
+
+
+def query_range(range_index, x0, x1):
+    # Returns (price min, price max, volume min, volume max) between x0 and x1, None meaning unbounded
+    dates = range_index["dates"]
+    i = (
+        0
+        if x0 is None
+        else np.searchsorted(dates, pd.Timestamp(x0).to_datetime64(), "left")
+    )
+    j = (
+        len(dates) - 1
+        if x1 is None
+        else np.searchsorted(dates, pd.Timestamp(x1).to_datetime64(), "right") - 1
+    )
+    if i > j:
+        return None
+    return tuple(
+        query_sparse_table(range_index[key], func, int(i), int(j))
+        for key, func in [
+            ("price_min", np.fmin),
+            ("price_max", np.fmax),
+            ("volume_min", np.fmin),
+            ("volume_max", np.fmax),
+        ]
+    )
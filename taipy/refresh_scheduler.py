@@ -0,0 +1,227 @@
+# %%
+import json
+import logging
+import os
+import threading
+import time
+import pandas as pd
+import price_store
+from price_store import (
+    get_history,
+    last_session,
+    market_close,
+    market_tz,
+    missing_ranges,
+    read_coverage,
+    to_date,
+)
+from providers import get_provider
+from constituents import get_constituents
+from series_store import invalidate
+from metrics import count, span
+
+# %% [markdown]
+# Background refresh of every constituent after each market close, so that the pages almost always
+# read from the price store instead of waiting on yfinance.<br>
+# Tickers missing the same dates are downloaded together in one bulk request, within a rate budget.
+# The yfinance bulk request (`yf.download`) is only ever called from this thread as it is not safe
+# across threads.<br>
+# Only one process refreshes the store, whatever the number of gunicorn workers: the one holding an
+# exclusive lock on a file of the store. The lock is released by the OS when the process exits, and
+# another worker takes over at its next attempt. The others serve the status the leader writes and
+# drop the series it has refreshed from their own series store.<br>
+# [yfinance download()](https://ranaroussi.github.io/yfinance/reference/api/yfinance.download.html)<br>
+# [flock()](https://man7.org/linux/man-pages/man2/flock.2.html)
+#
+
+# %%
+try:
+    import fcntl
+except ImportError:
+    # Windows runs the app in a single process, there is no other worker to leave the refresh to
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+# Coarser intervals are aggregated from the daily bars by the pages:
+refresh_intervals = ["1d"]
+# Every ticker is kept covered from this date to the last session:
+refresh_start = os.environ.get("SP500_REFRESH_START", "2020-01-01")
+batch_size = int(os.environ.get("SP500_REFRESH_BATCH", 50))
+requests_per_minute = float(os.environ.get("SP500_REFRESH_RATE", 30))
+# Time after the close for the last bars to be published:
+refresh_delay = pd.Timedelta(minutes=int(os.environ.get("SP500_REFRESH_DELAY", 30)))
+
+# Seconds between two attempts of a worker to take the refresh over:
+leader_retry = int(os.environ.get("SP500_REFRESH_LEADER_RETRY", 300))
+
+# {ticker: {interval: {"refreshed_at": ..., "error": ...}}}
+refresh_status = {}
+lock = threading.Lock()
+last_request = 0.0
+# Open lock file of the leader, kept for the life of the process:
+leader_file = None
+
+
+def lock_path():
+    return os.path.join(price_store.store_dir, "refresh.lock")
+
+
+def status_path():
+    return os.path.join(price_store.store_dir, "refresh_status.json")
+
+
+def acquire_leadership():
+    global leader_file
+    if fcntl is None:
+        return True
+    os.makedirs(price_store.store_dir, exist_ok=True)
+    file = open(lock_path(), "a")
+    try:
+        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        file.close()
+        return False
+    leader_file = file
+    return True
+
+
+def set_status(ticker, interval, error=None):
+    with lock:
+        refresh_status.setdefault(ticker, {})[interval] = {
+            "refreshed_at": pd.Timestamp.now(tz=market_tz).isoformat(),
+            "error": error,
+        }
+
+
+def get_refresh_status():
+    if leader_file is None and fcntl is not None:
+        # Another worker refreshes the store:
+        try:
+            with open(status_path()) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+    with lock:
+        return {ticker: dict(status) for ticker, status in refresh_status.items()}
+
+
+def write_refresh_status():
+    path = status_path()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(get_refresh_status(), file)
+    os.replace(tmp_path, path)
+
+
+# %%
+def wait_for_budget():
+    global last_request
+    time.sleep(max(0, last_request + 60 / requests_per_minute - time.monotonic()))
+    last_request = time.monotonic()
+
+
+def download_batch(tickers, interval, start, end):
+    # One request for the whole batch, returning {ticker: prices}
+    wait_for_budget()
+    with span("bulk_history"):
+        return get_provider()["bulk_history"](tickers, start, end, interval)
+
+
+def refresh_interval(tickers, interval):
+    start, end = to_date(refresh_start), last_session(pd.Timestamp.today())
+    # Group the tickers by the date ranges they miss so each group is one request per batch:
+    groups = {}
+    for ticker in tickers:
+        gaps = tuple(missing_ranges(read_coverage(ticker, interval), start, end))
+        if len(gaps) == 0:
+            set_status(ticker, interval)
+        else:
+            groups.setdefault(gaps, []).append(ticker)
+    for gaps, group in groups.items():
+        for i in range(0, len(group), batch_size):
+            batch = group[i : i + batch_size]
+            try:
+                fetched = download_batch(
+                    batch, interval, gaps[0][0], gaps[-1][1] + pd.DateOffset(1)
+                )
+            except Exception as error:
+                logger.warning(
+                    "Failed to download a batch of %d tickers: %s", len(batch), error
+                )
+                count("errors_total", {"task": "refresh_batch"})
+                for ticker in batch:
+                    set_status(ticker, interval, str(error))
+                continue
+            for ticker in batch:
+                prices = fetched[ticker]
+                if len(prices) == 0:
+                    # Not written so the dates are not marked as covered, the next run tries again:
+                    set_status(ticker, interval, "no data")
+                    continue
+                get_history(
+                    ticker,
+                    start,
+                    end,
+                    interval,
+                    lambda start, end, prices=prices: prices.loc[
+                        start : end - pd.Timedelta(1)
+                    ],
+                )
+                # Sessions opened from now on get the new bars:
+                invalidate(ticker)
+                set_status(ticker, interval)
+
+
+def refresh_universe():
+    tickers = list(get_constituents()["Symbol"])
+    for interval in refresh_intervals:
+        refresh_interval(tickers, interval)
+    write_refresh_status()
+    failed = sum(
+        any(status["error"] is not None for status in intervals.values())
+        for intervals in get_refresh_status().values()
+    )
+    logger.info("Refreshed %d tickers, %d with errors", len(tickers), failed)
+
+
+# %%
+def next_run():
+    now = pd.Timestamp.now(tz=market_tz).tz_localize(None)
+    day = now.normalize()
+    if day.weekday() >= 5 or now >= day + market_close + refresh_delay:
+        day += pd.offsets.BDay()
+    return day + market_close + refresh_delay, now
+
+
+def follow_leader(seen):
+    # Series refreshed by the leader since the last check are loaded again from the store
+    status = get_refresh_status()
+    for ticker, intervals in status.items():
+        refreshed_at = [
+            s["refreshed_at"] for s in intervals.values() if s["error"] is None
+        ]
+        if len(refreshed_at) > 0 and seen.get(ticker) != max(refreshed_at):
+            seen[ticker] = max(refreshed_at)
+            invalidate(ticker)
+
+
+def refresh_loop():
+    seen = {}
+    while not acquire_leadership():
+        follow_leader(seen)
+        time.sleep(leader_retry)
+    while True:
+        try:
+            refresh_universe()
+        except Exception:
+            # The pages still fetch on demand, try again after the next close:
+            logger.exception("Failed to refresh the price store")
+            count("errors_total", {"task": "refresh"})
+        run, now = next_run()
+        time.sleep((run - now).total_seconds())
+
+
+def start_refresh_scheduler():
+    # A local dump is read directly and never changes, there is nothing to refresh:
+    if get_provider()["store"]:
+        threading.Thread(target=refresh_loop, daemon=True).start()
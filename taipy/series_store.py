@@ -0,0 +1,161 @@
+# %%
+import hashlib
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from functools import reduce
+import pandas as pd
+from price_store import to_date
+from metrics import cache_result
+
+# %% [markdown]
+# Process-wide store of price series shared by every session. Each series is kept once as a read-only
+# array and the frames handed to the sessions are zero-copy views over it (pandas Copy-on-Write), so
+# memory grows with the distinct data rather than with the number of sessions.<br>
+# Series are pinned in an LRU within a memory budget. An evicted series stays shared for as long as a
+# session still holds a view of it (weak references) and is freed with the last one.<br>
+# With `SP500_COMPACT_PRICES=1` prices are stored as float32 and volumes as int64, the series with
+# the same dates share one DatetimeIndex (counted once in the memory budget): about half the memory
+# of float64 prices, for 7 significant digits (cents up to $100,000). `price_block` hands the
+# sessions frames whose columns are zero-copy views of the stored arrays, whatever their selection
+# of tickers.<br>
+# [pandas Copy-on-Write](https://pandas.pydata.org/docs/user_guide/copy_on_write.html)<br>
+# [NumPy data types](https://numpy.org/doc/stable/user/basics.types.html)
+#
+
+# %%
+pd.set_option("mode.copy_on_write", True)
+
+memory_budget = int(os.environ.get("SP500_SERIES_STORE_BUDGET_MB", 512)) * 2**20
+compact = os.environ.get("SP500_COMPACT_PRICES", "0") == "1"
+integer_columns = {"Volume"}
+pinned = OrderedDict()
+pinned_bytes = 0
+# {id(array or index): number of keys pinning it}:
+pinned_counts = {}
+shared_indexes = weakref.WeakValueDictionary()
+shared_values = weakref.WeakValueDictionary()
+# {(name, dtype, digest of the dates): DatetimeIndex} in compact mode:
+date_indexes = weakref.WeakValueDictionary()
+lock = threading.Lock()
+
+
+def pin(key, array):
+    global pinned_bytes
+    if key in pinned:
+        pinned.move_to_end(key)
+        return
+    pinned[key] = array
+    # An index pinned by every ticker with the same dates only takes its memory once:
+    if pinned_counts.get(id(array), 0) == 0:
+        pinned_bytes += array.nbytes
+    pinned_counts[id(array)] = pinned_counts.get(id(array), 0) + 1
+    # Least recently used first, the weak references keep what the sessions still use:
+    while pinned_bytes > memory_budget and len(pinned) > 1:
+        _, evicted = pinned.popitem(last=False)
+        release(evicted)
+
+
+def release(array):
+    global pinned_bytes
+    pinned_counts[id(array)] -= 1
+    if pinned_counts[id(array)] == 0:
+        del pinned_counts[id(array)]
+        pinned_bytes -= array.nbytes
+
+
+def unpin(key):
+    if key in pinned:
+        release(pinned.pop(key))
+
+
+# %%
+def stored_array(values, column):
+    if not compact:
+        return values.to_numpy(copy=True)
+    if column in integer_columns:
+        # A missing bar has no volume traded:
+        return values.fillna(0).to_numpy(dtype="int64", copy=True)
+    # One exact-size array per column, so an evicted series frees what the budget counted:
+    return values.to_numpy(dtype="float32", copy=True)
+
+
+def shared_index(index):
+    # The same dates as a stored series, e.g. every ticker over the same sessions: one index object
+    if not compact or not isinstance(index, pd.DatetimeIndex):
+        return index
+    digest = hashlib.blake2b(index.asi8.tobytes(), digest_size=16).digest()
+    key = (index.name, str(index.dtype), digest)
+    with lock:
+        existing = date_indexes.get(key)
+        if existing is not None and existing.equals(index):
+            return existing
+        date_indexes[key] = index
+    return index
+
+
+def get_frame(ticker, interval, start, end, columns, load):
+    # Columns of a ticker's history shared with every session, load() is only called on a miss
+    key = (ticker, interval, to_date(start), to_date(end), tuple(columns))
+    with lock:
+        index = shared_indexes.get(key)
+        values = {column: shared_values.get((key, column)) for column in columns}
+        found = index is not None and all(v is not None for v in values.values())
+        if found:
+            pin(key, index)
+            for column in columns:
+                pin((key, column), values[column])
+    cache_result("series_store", hits=int(found), misses=int(not found))
+    if not found:
+        frame = load()
+        if len(frame) == 0:
+            # Not stored so that the next request tries again:
+            return frame.reindex(columns=columns)
+        index = shared_index(frame.index)
+        # One compact read-only array per column, nothing can write through a shared view:
+        values = {column: stored_array(frame[column], column) for column in columns}
+        for array in values.values():
+            array.flags.writeable = False
+        with lock:
+            shared_indexes[key] = index
+            pin(key, index)
+            for column in columns:
+                shared_values[(key, column)] = values[column]
+                pin((key, column), values[column])
+    return pd.DataFrame(
+        {
+            column: pd.Series(values[column], index=index, copy=False)
+            for column in columns
+        },
+        copy=False,
+    )
+
+
+def price_block(series):
+    # {ticker: series} as one frame with a column per ticker. In compact mode the columns of the
+    # tickers sharing the dates are zero-copy views of the stored arrays, only the others are
+    # aligned on the union of the dates
+    if not compact:
+        return pd.concat(series, axis=1)
+    indexes = [values.index for values in series.values()]
+    index = reduce(lambda a, b: a if a is b else a.union(b), indexes)
+    return pd.DataFrame(
+        {
+            ticker: values if values.index is index else values.reindex(index)
+            for ticker, values in series.items()
+        },
+        index=shared_index(index),
+        copy=False,
+    )
+
+
+def invalidate(ticker):
+    # Newer data for the ticker: sessions keep their views, the next request loads again
+    with lock:
+        for key in [key for key in shared_indexes.keys() if key[0] == ticker]:
+            for column in key[4]:
+                shared_values.pop((key, column), None)
+                unpin((key, column))
+            shared_indexes.pop(key, None)
+            unpin(key)
@@ -0,0 +1,65 @@
+from flask import Flask, Response, jsonify, request, send_from_directory
+from taipy.gui import Gui
+import taipy.gui.builder as tgb
+from SP500_stock_dashboard import stock_page
+from SP500_stocks_dashboard import stocks_page
+from warm_up import on_init, ready, start_warm_up
+from refresh_scheduler import get_refresh_status, start_refresh_scheduler
+from live_feed import start_live_feed
+from metrics import render_metrics
+from race_export import animation_dir
+
+with tgb.Page() as root_page:
+    with tgb.part("container"):
+        with tgb.layout("30rem 1", class_name="card p0 pt-half"):
+            tgb.text("S&P 500 stocks visualization", class_name="text-weight900 pl1")
+            with tgb.part("text-center"):
+                tgb.navbar()
+    tgb.html("br")
+
+pages = {"/": root_page, "stock": stock_page, "stocks": stocks_page}
+
+flask_app = Flask(__name__)
+
+
+# Readiness probe for the load balancer: only route traffic once the default data is warmed up
+@flask_app.route("/ready")
+def readiness():
+    if ready.is_set():
+        return "ready", 200
+    return "warming up", 503
+
+
+# Last end-of-day refresh of every ticker and interval, or of one ticker with ?ticker=AAPL
+@flask_app.route("/refresh-status")
+def refresh_status():
+    status = get_refresh_status()
+    ticker = request.args.get("ticker")
+    if ticker is not None:
+        return jsonify({ticker: status.get(ticker, {})})
+    return jsonify(status)
+
+
+# Callback timings, cache hit ratios, bytes fetched and figure sizes of this worker for Prometheus
+@flask_app.route("/metrics")
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+# Cached bar chart race animations and the plotly.min.js they share
+@flask_app.route("/animations/<path:name>")
+def animations(name):
+    return send_from_directory(animation_dir, name, max_age=24 * 60 * 60)
+
+
+tp_app = Gui(pages=pages, flask=flask_app)
+tp_app.on_init = on_init
+
+
+def start_background_tasks():
+    # The server starts straight away while the default tickers are fetched in the background:
+    start_warm_up(tp_app)
+    # Every constituent is refreshed after each close so user requests are served from the store:
+    start_refresh_scheduler()
+    # Intraday bars of the tickers shown in the live mode, pushed to their sessions:
+    start_live_feed(tp_app)
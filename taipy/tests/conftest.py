@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The dashboard modules are imported by name, like `python app.py` does from the taipy directory:
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
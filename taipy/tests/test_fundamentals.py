@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+import fundamentals
+from fundamentals import is_stale, read_statement, refresh_statement
+
+
+@pytest.fixture(autouse=True)
+def fundamentals_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(fundamentals, "fundamentals_dir", str(tmp_path))
+
+
+def statement(quarters):
+    index = pd.DatetimeIndex(quarters, name="Quarter")
+    return pd.DataFrame({"Diluted Average Shares": 1e9}, index=index)
+
+
+def test_refresh_merges_the_stored_quarters(monkeypatch):
+    fetched = [
+        statement(["2023-12-30", "2024-03-30"]),
+        statement(["2024-06-29", "2024-03-30"]),
+    ]
+    monkeypatch.setattr(fundamentals, "fetch_statement", lambda ticker: fetched.pop(0))
+    refresh_statement("AAPL", None)
+    stored, _ = read_statement("AAPL")
+    refresh_statement("AAPL", stored)
+    stored, checked_at = read_statement("AAPL")
+    assert list(stored.index) == list(
+        pd.to_datetime(["2023-12-30", "2024-03-30", "2024-06-29"])
+    )
+    assert checked_at is not None
+
+
+def test_failed_fetch_keeps_the_stored_quarters(monkeypatch):
+    def fail(ticker):
+        raise ConnectionError("rate limited")
+
+    monkeypatch.setattr(fundamentals, "fetch_statement", fail)
+    cached = statement(["2024-06-29"])
+    assert refresh_statement("AAPL", cached) is cached
+    assert read_statement("AAPL") == (None, None)
+
+
+def test_stale_after_the_next_fiscal_quarter_is_filed():
+    # A fiscal quarter ending on a Saturday, not on a calendar quarter end:
+    reported = statement(["2024-03-30", "2024-06-29"])
+    checked_at = pd.Timestamp("2024-08-05")
+    assert not is_stale(reported, checked_at, pd.Timestamp("2024-08-06"))
+    assert not is_stale(reported, checked_at, pd.Timestamp("2024-11-01"))
+    assert is_stale(reported, checked_at, pd.Timestamp("2024-11-08"))
+    assert is_stale(None, None, pd.Timestamp("2024-08-06"))
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+import history_table
+from history_table import export_history, get_page
+
+
+@pytest.fixture(autouse=True)
+def small_pages(monkeypatch):
+    monkeypatch.setattr(history_table, "page_size", 7)
+    monkeypatch.setattr(history_table, "export_chunk_rows", 11)
+
+
+def history(n=120, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2024-01-01", periods=n, freq="D", name="Date")
+    close = rng.permutation(n).astype(float)
+    close[rng.choice(n, 5, replace=False)] = np.nan
+    return pd.DataFrame({"Close": close, "Volume": rng.integers(0, 1000, n)}, index)
+
+
+def expected_rows(frame, start, end, sort_column, descending):
+    rows = frame.loc[start:end].reset_index()
+    return rows.sort_values(
+        sort_column, ascending=not descending, kind="stable", na_position="last"
+    ).reset_index(drop=True)
+
+
+def all_pages(frame, start, end, sort_column, descending):
+    pages = []
+    page, n_rows = 0, None
+    while n_rows is None or page * history_table.page_size < n_rows:
+        rows, n_rows, _ = get_page(frame, page, start, end, sort_column, descending)
+        pages.append(rows)
+        page += 1
+    return pd.concat(pages, ignore_index=True), n_rows
+
+
+@pytest.mark.parametrize("sort_column", ["Date", "Close"])
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("start, end", [(None, None), ("2024-01-15", "2024-03-10")])
+def test_pages_match_the_sorted_filter(sort_column, descending, start, end):
+    frame = history()
+    rows, n_rows = all_pages(frame, start, end, sort_column, descending)
+    expected = expected_rows(frame, start, end, sort_column, descending)
+    assert n_rows == len(expected)
+    pd.testing.assert_frame_equal(rows, expected)
+
+
+def test_page_past_the_end_shows_the_last_page():
+    frame = history()
+    rows, n_rows, page = get_page(frame, 100, None, None)
+    assert (n_rows, page) == (120, 17)
+    assert list(rows["Date"]) == list(frame.index[119:])
+    rows, n_rows, page = get_page(frame, 3, "2025-01-01", None)
+    assert (len(rows), n_rows, page) == (0, 0, 0)
+
+
+def test_export_writes_every_filtered_row():
+    frame = history()
+    path = export_history(frame, "2024-01-15", "2024-03-10", "Close", True, "csv")
+    try:
+        exported = pd.read_csv(path, parse_dates=["Date"])
+    finally:
+        history_table.os.remove(path)
+    expected = expected_rows(frame, "2024-01-15", "2024-03-10", "Close", True)
+    pd.testing.assert_frame_equal(exported, expected, check_dtype=False)
+
+
+def test_filter_from_the_date_pickers():
+    # tgb.date sends ISO strings ending in "Z", parsed as tz-aware datetimes:
+    frame = history()
+    start = pd.Timestamp("2024-01-15T00:00:00Z").to_pydatetime()
+    end = pd.Timestamp("2024-03-10T00:00:00Z").to_pydatetime()
+    rows, n_rows = all_pages(frame, start, end, "Close", False)
+    pd.testing.assert_frame_equal(
+        rows, expected_rows(frame, "2024-01-15", "2024-03-10", "Close", False)
+    )
+    path = export_history(frame, start, end, "Date", False, "csv")
+    try:
+        assert len(pd.read_csv(path)) == n_rows
+    finally:
+        history_table.os.remove(path)
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+from indicators import compute_indicators, price_matrix, update_indicators
+
+
+def prices(n=400, tickers=("AAA", "BBB", "CCC"), seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2022-01-03", periods=n, freq="B", name="Date")
+    histories = {}
+    for ticker in tickers:
+        close = 100 * np.exp(rng.normal(0, 0.02, n).cumsum())
+        histories[ticker] = pd.DataFrame(
+            {
+                "Open": close * (1 + rng.normal(0, 0.005, n)),
+                "High": close * (1 + rng.uniform(0, 0.02, n)),
+                "Low": close * (1 - rng.uniform(0, 0.02, n)),
+                "Close": close,
+                "Volume": rng.integers(1_000, 100_000, n).astype(float),
+            },
+            index=index,
+        )
+    return price_matrix(histories)
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 60])
+def test_incremental_update_matches_full_computation(chunk):
+    matrix = prices()
+    full, _ = compute_indicators(matrix)
+    first, state = compute_indicators(matrix.iloc[:250])
+    parts = [first]
+    for start in range(250, len(matrix), chunk):
+        rows, state = update_indicators(state, matrix.iloc[start : start + chunk])
+        parts.append(rows)
+    incremental = pd.concat(parts)[full.columns]
+    pd.testing.assert_frame_equal(incremental, full, rtol=1e-9)
+
+
+def test_update_without_new_bars_keeps_the_state():
+    matrix = prices()
+    _, state = compute_indicators(matrix)
+    rows, same_state = update_indicators(state, matrix.iloc[:0])
+    assert len(rows) == 0 and same_state is state
+
+
+def test_no_bars():
+    indicators, state = compute_indicators(prices().iloc[:0])
+    assert len(indicators) == 0 and state is None
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+import live_feed
+from live_feed import append_bars, append_rows, buffer_frame, fields, new_buffer
+from indicators import compute_indicators, price_matrix
+
+
+@pytest.fixture(autouse=True)
+def empty_feed(monkeypatch):
+    monkeypatch.setattr(live_feed, "buffers", {})
+    monkeypatch.setattr(live_feed, "indicator_states", {})
+
+
+def minute_bars(n):
+    index = pd.date_range("2024-01-02 09:30", periods=n, freq="1min", name="Date")
+    close = 100 + np.random.default_rng(0).standard_normal(n).cumsum()
+    return pd.DataFrame(
+        {
+            "Open": close,
+            "High": close + 1,
+            "Low": close - 1,
+            "Close": close,
+            "Volume": np.arange(n, dtype=float) + 100,
+        },
+        index=index,
+    )
+
+
+def in_progress(bars):
+    # The last bar as polled before it closed
+    bars = bars.copy()
+    bars.iloc[-1, bars.columns.get_loc("Close")] -= 0.5
+    bars.iloc[-1, bars.columns.get_loc("Volume")] /= 2
+    return bars
+
+
+def test_ring_buffer_keeps_the_last_rows():
+    buffer = new_buffer(["Close"], size=4)
+    times = pd.date_range("2024-01-02", periods=6, freq="1min").to_numpy()
+    append_rows(buffer, times[:3], np.arange(3.0)[:, None])
+    append_rows(buffer, times[3:], np.arange(3.0, 6.0)[:, None])
+    frame = buffer_frame(buffer)
+    assert list(frame["Close"]) == [2.0, 3.0, 4.0, 5.0]
+    assert (frame.index == times[2:]).all()
+
+
+def test_bar_in_progress_is_replaced():
+    bars = minute_bars(120)
+    append_bars("AAA", in_progress(bars.iloc[:50]))
+    append_bars("AAA", in_progress(bars.iloc[49:50]))
+    append_bars("AAA", in_progress(bars.iloc[49:90]))
+    append_bars("AAA", bars.iloc[89:])
+    frame = buffer_frame(live_feed.buffers["AAA"])
+    expected, _ = compute_indicators(price_matrix({"AAA": bars}))
+    expected = expected.xs("AAA", axis=1, level=1)
+    assert frame.index.equals(bars.index)
+    np.testing.assert_allclose(frame[fields].to_numpy(), bars.to_numpy())
+    np.testing.assert_allclose(
+        frame[expected.columns].to_numpy(), expected.to_numpy(), equal_nan=True
+    )
@@ -0,0 +1,46 @@
+from taipy.gui import Gui
+import metrics
+from metrics import count, render_metrics, span, timed
+
+
+def span_count(name):
+    key = ("span_seconds", (("span", name),))
+    return metrics.histograms.get(key, {"count": 0})["count"]
+
+
+def test_timed_callback_gets_every_argument():
+    received = []
+
+    @timed
+    def on_change(state, var_name, value):
+        received.append((state, var_name, value))
+
+    calls = span_count("on_change")
+    # How Taipy calls on_change, on_action and invoke_long_callback status functions:
+    Gui()._call_function_with_state(on_change, ["ticker", "AAPL"])
+    assert received == [(None, "ticker", "AAPL")]
+    assert on_change.__code__.co_argcount == 3
+    assert on_change.__name__ == "on_change"
+    assert span_count("on_change") == calls + 1
+
+
+def test_timed_keeps_defaults_and_varargs():
+    @timed
+    def with_defaults(state, id=None, payload=None):
+        return state, id, payload
+
+    @timed
+    def with_varargs(*args, **kwargs):
+        return args, kwargs
+
+    assert with_defaults("state") == ("state", None, None)
+    assert with_varargs(1, a=2) == ((1,), {"a": 2})
+
+
+def test_render_metrics():
+    with span("test_render"):
+        pass
+    count("test_requests_total", {"result": "hit"}, 2)
+    text = render_metrics()
+    assert 'sp500_span_seconds_count{span="test_render"} 1' in text
+    assert 'sp500_test_requests_total{result="hit"} 2' in text
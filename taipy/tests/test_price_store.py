@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+import pytest
+import price_store
+from price_store import get_history, merge_ranges, missing_ranges, read_coverage
+
+
+@pytest.fixture(autouse=True)
+def store_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(price_store, "store_dir", str(tmp_path))
+
+
+def bars(start, end):
+    index = pd.date_range(start, end, freq="B", inclusive="left", name="Date")
+    close = np.arange(len(index), dtype=float) + 100
+    return pd.DataFrame({"Close": close, "Volume": np.arange(len(index))}, index=index)
+
+
+def empty_bars(start, end):
+    return bars(start, end).iloc[:0]
+
+
+def test_merge_ranges_joins_touching_ranges():
+    day = pd.Timestamp
+    ranges = [
+        (day("2024-02-01"), day("2024-02-10")),
+        (day("2024-01-01"), day("2024-01-31")),
+        (day("2024-03-01"), day("2024-03-05")),
+    ]
+    assert merge_ranges(ranges) == [
+        (day("2024-01-01"), day("2024-02-10")),
+        (day("2024-03-01"), day("2024-03-05")),
+    ]
+
+
+def test_missing_ranges():
+    day = pd.Timestamp
+    coverage = [(day("2024-01-10"), day("2024-01-20"))]
+    assert missing_ranges(coverage, day("2024-01-01"), day("2024-01-31")) == [
+        (day("2024-01-01"), day("2024-01-09")),
+        (day("2024-01-21"), day("2024-01-31")),
+    ]
+    assert missing_ranges(coverage, day("2024-01-12"), day("2024-01-15")) == []
+
+
+def test_only_gaps_are_downloaded():
+    calls = []
+
+    def download(start, end):
+        calls.append((start, end))
+        return bars(start, end)
+
+    get_history("AAA", "2024-01-08", "2024-01-31", "1d", download)
+    prices = get_history("AAA", "2024-01-02", "2024-02-29", "1d", download)
+    assert calls[1:] == [
+        (pd.Timestamp("2024-01-02"), pd.Timestamp("2024-01-08")),
+        (pd.Timestamp("2024-02-01"), pd.Timestamp("2024-03-01")),
+    ]
+    assert prices.index.is_monotonic_increasing and prices.index.is_unique
+    assert read_coverage("AAA", "1d") == [
+        (pd.Timestamp("2024-01-02"), pd.Timestamp("2024-02-29"))
+    ]
+
+
+def test_empty_download_is_not_covered():
+    calls = []
+
+    def download(start, end):
+        calls.append((start, end))
+        # Nothing comes back for February, e.g. a rate limit:
+        return bars(start, end) if start.month == 1 else empty_bars(start, end)
+
+    get_history("AAA", "2024-01-02", "2024-01-31", "1d", download)
+    prices = get_history("AAA", "2024-01-02", "2024-02-29", "1d", download)
+    assert prices.index[-1] == pd.Timestamp("2024-01-31")
+    assert read_coverage("AAA", "1d") == [
+        (pd.Timestamp("2024-01-02"), pd.Timestamp("2024-01-31"))
+    ]
+    # The next request asks for February again:
+    get_history("AAA", "2024-01-02", "2024-02-29", "1d", download)
+    assert calls[-1] == (pd.Timestamp("2024-02-01"), pd.Timestamp("2024-03-01"))
+
+
+def test_gap_without_sessions_is_covered():
+    get_history("AAA", "2024-01-08", "2024-01-31", "1d", bars)
+    # January 6 and 7 are a weekend, nothing is expected from the download:
+    get_history("AAA", "2024-01-06", "2024-01-31", "1d", empty_bars)
+    assert read_coverage("AAA", "1d") == [
+        (pd.Timestamp("2024-01-06"), pd.Timestamp("2024-01-31"))
+    ]
+
+
+def test_last_session_skips_holidays():
+    assert price_store.last_session("2024-07-04") == pd.Timestamp("2024-07-03")
+    assert price_store.last_session("2024-03-30") == pd.Timestamp("2024-03-28")
+
+
+def test_coverage_of_separate_requests_is_merged():
+    get_history("AAA", "2024-01-02", "2024-01-31", "1d", bars)
+    get_history("AAA", "2024-03-01", "2024-03-28", "1d", bars)
+    assert len(read_coverage("AAA", "1d")) == 2
+    prices = get_history("AAA", "2024-01-15", "2024-03-15", "1d", bars)
+    assert read_coverage("AAA", "1d") == [
+        (pd.Timestamp("2024-01-02"), pd.Timestamp("2024-03-28"))
+    ]
+    assert prices.index.is_unique
+    assert prices.index.equals(bars("2024-01-15", "2024-03-16").index)
+
+
+def test_range_without_a_closed_session():
+    def download(start, end):
+        pytest.fail("no session to download")
+
+    # A weekend and a holiday, nothing stored for the ticker yet:
+    for start, end in [("2024-01-06", "2024-01-07"), ("2024-07-04", "2024-07-04")]:
+        prices = get_history("AAA", start, end, "1d", download)
+        assert len(prices) == 0
+        assert list(prices.columns) == price_store.ohlcv_columns
+        assert not price_store.is_cached("AAA", "1d", start, end)
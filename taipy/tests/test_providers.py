@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+from providers import resample_bars
+
+
+def daily_bars(seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2023-01-02", "2023-12-29", freq="B", name="Date")
+    # No session for two weeks of August, so one week has no bar at all:
+    index = index[(index < "2023-08-07") | (index > "2023-08-18")]
+    n = len(index)
+    close = 100 + rng.normal(0, 1, n).cumsum()
+    return pd.DataFrame(
+        {
+            "Open": close + rng.normal(0, 0.5, n),
+            "High": close + rng.uniform(0, 2, n),
+            "Low": close - rng.uniform(0, 2, n),
+            "Close": close,
+            "Volume": rng.integers(1_000, 100_000, n),
+            "MA50": close,
+        },
+        index=index,
+    )
+
+
+def brute_force(bars, period_start):
+    # One group per period, labelled by its first day, derived columns taking the last value
+    rows = []
+    for label, group in bars.groupby(period_start(bars.index)):
+        rows.append(
+            pd.Series(
+                {
+                    "Open": group["Open"].iloc[0],
+                    "High": group["High"].max(),
+                    "Low": group["Low"].min(),
+                    "Close": group["Close"].iloc[-1],
+                    "Volume": group["Volume"].sum(),
+                    "MA50": group["MA50"].iloc[-1],
+                },
+                name=label,
+            )
+        )
+    return pd.DataFrame(rows)
+
+
+def test_weekly_and_monthly_bars():
+    bars = daily_bars()
+    periods = {
+        "1wk": lambda index: index.to_period("W-SUN").start_time,
+        "1mo": lambda index: index.to_period("M").start_time,
+        "3mo": lambda index: index.to_period("Q").start_time,
+    }
+    for interval, period_start in periods.items():
+        resampled = resample_bars(bars, interval)
+        expected = brute_force(bars, period_start)
+        np.testing.assert_array_equal(resampled.index, expected.index)
+        np.testing.assert_allclose(
+            resampled.to_numpy(dtype=float), expected.to_numpy(dtype=float)
+        )
+    # The weeks of August 7 and 14 have no session and no bar:
+    weeks = resample_bars(bars, "1wk").index
+    assert pd.Timestamp("2023-08-07") not in weeks
+    assert pd.Timestamp("2023-08-14") not in weeks
+
+
+def test_many_tickers_at_once():
+    histories = {"AAA": daily_bars(0), "BBB": daily_bars(1)}
+    matrix = pd.concat(histories, axis=1).swaplevel(axis=1).sort_index(axis=1)
+    resampled = resample_bars(matrix, "1mo")
+    for ticker, bars in histories.items():
+        alone = resample_bars(bars, "1mo")
+        together = resampled.xs(ticker, axis=1, level=1)[alone.columns]
+        pd.testing.assert_frame_equal(together, alone, check_dtype=False)
+
+
+def test_daily_bars_are_returned_as_is():
+    bars = daily_bars()
+    assert resample_bars(bars, "1d") is bars
@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+import pytest
+import race_export
+from race_export import get_animation
+
+
+@pytest.fixture(autouse=True)
+def animation_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(race_export, "animation_dir", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    # Names of the rendered files, with a slow render so that requests overlap
+    rendered = []
+
+    def write_html(path, data, *args):
+        rendered.append(os.path.basename(path))
+        time.sleep(0.2)
+        with open(path, "w") as file:
+            file.write("x" * 1000)
+
+    monkeypatch.setattr(race_export, "write_html", write_html)
+    return rendered
+
+
+def race(seed):
+    values = np.random.default_rng(seed).random((3, 4))
+    return pd.DataFrame(values, columns=["A", "B", "C", "D"])
+
+
+def request_all(datasets):
+    threads = [
+        threading.Thread(target=get_animation, args=(data,)) for data in datasets
+    ]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - began
+
+
+def test_same_race_is_rendered_once(renders):
+    request_all([race(0)] * 4)
+    assert len(renders) == 1
+
+
+def test_different_races_render_concurrently(renders):
+    elapsed = request_all([race(seed) for seed in range(4)])
+    assert len(renders) == 4
+    assert elapsed < 0.6
+
+
+def test_least_recently_served_animations_are_pruned(renders, monkeypatch):
+    monkeypatch.setattr(race_export, "disk_budget", 2500)
+    first = get_animation(race(0))
+    second = get_animation(race(1))
+    os.utime(os.path.join(race_export.animation_dir, second), (0, 0))
+    os.utime(os.path.join(race_export.animation_dir, first), (1, 1))
+    # Served again, so the first race is now the most recently used:
+    get_animation(race(0))
+    third = get_animation(race(2))
+    assert sorted(os.listdir(race_export.animation_dir)) == sorted([first, third])
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+from race_frames import race_frames, race_matrix, top_frames
+
+
+def race_data(n_periods=12, n_tickers=30, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.uniform(1, 1000, (n_periods, n_tickers))
+    # Tickers entering and leaving the index:
+    values[rng.random(values.shape) < 0.2] = np.nan
+    index = pd.date_range("2020-03-31", periods=n_periods, freq="QE")
+    return pd.DataFrame(
+        values, index=index, columns=[f"T{i}" for i in range(n_tickers)]
+    )
+
+
+def naive_top(row, n_bars):
+    return row.dropna().sort_values(ascending=False).head(n_bars)
+
+
+def test_top_frames_match_a_sort_per_period():
+    data = race_data()
+    frames = list(top_frames(data, n_bars=10))
+    assert [period for period, _ in frames] == list(data.index)
+    for (_, top), (_, row) in zip(frames, data.iterrows()):
+        pd.testing.assert_series_equal(top, naive_top(row, 10), check_names=False)
+
+
+def test_race_frames_start_each_period_on_its_ranking():
+    data = race_data()
+    frames = list(race_frames(data, n_bars=10, steps_per_period=4))
+    assert len(frames) == 4 * (len(data) - 1) + 1
+    starts = [frame for frame in frames if frame["step"] == 0]
+    for frame, (period, row) in zip(starts, data.iterrows()):
+        expected = naive_top(row, 10)
+        assert frame["period"] == period
+        assert list(frame["tickers"]) == list(expected.index)
+        np.testing.assert_allclose(frame["values"], expected.to_numpy())
+        np.testing.assert_array_equal(frame["positions"], np.arange(len(expected)))
+
+
+def test_race_frames_interpolate_between_periods():
+    data = race_data()
+    for frame in race_frames(data, n_bars=10, steps_per_period=4):
+        # Bars are in position order and only the top positions are on screen:
+        assert np.all(np.diff(frame["positions"]) >= 0)
+        assert np.all(frame["positions"] < 10)
+        assert not np.isnan(frame["values"]).any()
+
+
+def test_race_matrix_from_long_rows():
+    long = pd.DataFrame(
+        {"ticker": ["B", "A", "A", "B"], "shares": [2.0, 1.0, 3.0, 4.0]},
+        index=pd.to_datetime(["2020-06-30", "2020-03-31", "2020-06-30", "2020-03-31"]),
+    )
+    matrix = race_matrix(long, value_column="shares")
+    assert list(matrix.columns) == ["A", "B"]
+    assert matrix.to_numpy().tolist() == [[1.0, 4.0], [3.0, 2.0]]
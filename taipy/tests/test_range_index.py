@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+from range_index import build_range_index, query_range
+
+
+def history(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2023-01-02", periods=n, freq="B", name="Date")
+    close = 100 + rng.normal(0, 1, n).cumsum()
+    frame = pd.DataFrame(
+        {
+            "Open": close + rng.normal(0, 0.5, n),
+            "High": close + rng.uniform(0, 2, n),
+            "Low": close - rng.uniform(0, 2, n),
+            "Close": close,
+            "Volume": rng.integers(1_000, 1_000_000, n).astype(float),
+        },
+        index=index,
+    )
+    # Moving averages start with NaN, and a few bars are missing:
+    frame["MA50"] = frame["Close"].rolling(50).mean()
+    frame.iloc[rng.choice(n, 10, replace=False), :4] = np.nan
+    return frame
+
+
+def brute_force(frame, x0, x1):
+    rows = frame.loc[x0:x1]
+    if len(rows) == 0:
+        return None
+    prices = rows.drop(columns="Volume").to_numpy()
+    volume = rows["Volume"].to_numpy()
+    return (
+        np.nanmin(prices),
+        np.nanmax(prices),
+        np.nanmin(volume),
+        np.nanmax(volume),
+    )
+
+
+def test_query_range_matches_brute_force():
+    frame = history()
+    range_index = build_range_index(frame)
+    rng = np.random.default_rng(1)
+    dates = pd.date_range("2022-12-20", "2024-03-01")
+    bounds = [(None, None), (None, "2023-06-30"), ("2023-06-30", None)]
+    bounds += [tuple(sorted(rng.choice(dates, 2))) for _ in range(200)]
+    for x0, x1 in bounds:
+        assert query_range(range_index, x0, x1) == brute_force(frame, x0, x1)
+
+
+def test_range_without_bars():
+    range_index = build_range_index(history())
+    # A weekend between two sessions, and a range before the history:
+    assert query_range(range_index, "2023-01-07", "2023-01-08") is None
+    assert query_range(range_index, "2020-01-01", "2020-12-31") is None
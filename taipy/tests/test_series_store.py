@@ -0,0 +1,83 @@
+import gc
+import tracemalloc
+import weakref
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import pytest
+import series_store
+from series_store import get_frame, invalidate, price_block
+
+dates = pd.date_range("2024-01-01", periods=100, freq="B", name="Date")
+
+
+@pytest.fixture(autouse=True)
+def compact_store(monkeypatch):
+    monkeypatch.setattr(series_store, "compact", True)
+    monkeypatch.setattr(series_store, "pinned", OrderedDict())
+    monkeypatch.setattr(series_store, "pinned_bytes", 0)
+    monkeypatch.setattr(series_store, "pinned_counts", {})
+    monkeypatch.setattr(series_store, "shared_indexes", weakref.WeakValueDictionary())
+    monkeypatch.setattr(series_store, "shared_values", weakref.WeakValueDictionary())
+    monkeypatch.setattr(series_store, "date_indexes", weakref.WeakValueDictionary())
+
+
+def close(ticker, index=dates):
+    values = np.arange(len(index), dtype=float) + 100 * int(ticker[1:])
+    frame = pd.DataFrame({"Close": values}, index=index.copy())
+    return get_frame(ticker, "1d", "2024-01-01", "2024-06-01", ["Close"], lambda: frame)
+
+
+def test_price_block_views_the_stored_rows():
+    stored = {f"T{i}": close(f"T{i}")["Close"] for i in range(5)}
+    block = price_block(stored)
+    assert list(block.columns) == list(stored)
+    for ticker, values in stored.items():
+        assert block[ticker].dtype == "float32"
+        assert np.shares_memory(block[ticker].to_numpy(), values.to_numpy())
+        assert block[ticker].equals(values)
+    with pytest.raises(ValueError):
+        block["T0"].to_numpy()[0] = 0
+
+
+def test_price_block_aligns_other_dates():
+    stored = {"T1": close("T1")["Close"], "T2": close("T2", dates[10:])["Close"]}
+    block = price_block(stored)
+    assert block.index.equals(dates)
+    assert block["T2"].isna().sum() == 10
+    assert np.shares_memory(block["T1"].to_numpy(), stored["T1"].to_numpy())
+
+
+def test_shared_index_is_counted_once():
+    for i in range(3):
+        close(f"T{i}")
+    assert series_store.pinned_bytes == dates.nbytes + 3 * 4 * len(dates)
+    for i in range(3):
+        invalidate(f"T{i}")
+    assert series_store.pinned_bytes == 0
+
+
+def test_hits_are_served_from_the_store():
+    first = close("T1")
+    again = get_frame(
+        "T1", "1d", "2024-01-01", "2024-06-01", ["Close"], lambda: pytest.fail()
+    )
+    assert np.shares_memory(first["Close"].to_numpy(), again["Close"].to_numpy())
+
+
+def test_evicted_series_are_freed(monkeypatch):
+    long_dates = pd.date_range("2000-01-03", periods=5000, freq="B", name="Date")
+    closes = 4 * len(long_dates)
+    # Room for the shared index and 10 of the float32 closes:
+    monkeypatch.setattr(series_store, "memory_budget", long_dates.nbytes + 10 * closes)
+    tracemalloc.start()
+    try:
+        for i in range(30):
+            close(f"T{i}", long_dates)
+        gc.collect()
+        resident = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    assert len(series_store.shared_values) == 10
+    # What stays allocated is what the budget counts, give or take the bookkeeping:
+    assert resident < series_store.memory_budget + 2 * closes
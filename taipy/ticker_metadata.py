@@ -0,0 +1,43 @@
+# %%
+import os
+import time
+
+# %% [markdown]
+# Ticker metadata built once from the S&P 500 constituents table so that fetching prices never needs a
+# `yf.Ticker(ticker).info` round-trip (one of the slowest yfinance calls) just to normalize a symbol.
+#
+
+# %%
+# Seconds before a cached market cap is fetched again:
+metadata_ttl = int(os.environ.get("SP500_METADATA_TTL", 6 * 60 * 60))
+symbol_map = {}
+name_map = {}
+market_cap_cache = {}
+
+
+def load_constituents(sp500):
+    # Yahoo Finance writes share classes with a dash instead of a dot, e.g. BRK.B -> BRK-B:
+    symbol_map.update(
+        zip(sp500["Symbol"], sp500["Symbol"].str.replace(".", "-", regex=False))
+    )
+    name_map.update(zip(sp500["Symbol"], sp500["Security"]))
+
+
+# %%
+def provider_symbol(ticker):
+    return symbol_map.get(ticker, ticker.replace(".", "-"))
+
+
+def short_name(ticker):
+    return name_map.get(ticker, ticker)
+
+
+def market_cap(ticker, fetch):
+    # fetch(ticker) is the market cap lookup of the selected provider
+    now = time.monotonic()
+    cached = market_cap_cache.get(ticker)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    value = fetch(ticker)
+    market_cap_cache[ticker] = (now + metadata_ttl, value)
+    return value
@@ -0,0 +1,57 @@
+# %%
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from metrics import count
+
+# %% [markdown]
+# Deferred warm-up of the default page data so the server can start serving straight away.<br>
+# Each page registers a task that fetches its defaults in the background and a callback that pushes
+# them to a session still showing the placeholders.<br>
+# [Taipy broadcast_callback()](https://docs.taipy.io/en/latest/refmans/reference/pkg_taipy/pkg_gui/Gui/#taipy.gui.Gui.broadcast_callback)
+#
+
+# %%
+logger = logging.getLogger(__name__)
+ready = threading.Event()
+warm_up_tasks = []
+session_updates = []
+
+
+def register_warm_up(task, update_session):
+    warm_up_tasks.append(task)
+    session_updates.append(update_session)
+
+
+def update_session(state):
+    for update in session_updates:
+        update(state)
+
+
+def on_init(state):
+    # Sessions opened after the warm-up get the default data right away:
+    if ready.is_set():
+        update_session(state)
+
+
+# %%
+def run_warm_up(gui):
+    def run_task(task):
+        try:
+            task()
+        except Exception:
+            # Pages keep their placeholders and fetch on demand instead:
+            logger.exception(
+                "Warm-up task %s.%s failed", task.__module__, task.__name__
+            )
+            count("errors_total", {"task": "warm_up"})
+
+    with ThreadPoolExecutor() as executor:
+        list(executor.map(run_task, warm_up_tasks))
+    ready.set()
+    # Sessions already connected are still showing the placeholders:
+    gui.broadcast_callback(update_session)
+
+
+def start_warm_up(gui):
+    threading.Thread(target=run_warm_up, args=(gui,), daemon=True).start()